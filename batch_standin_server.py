@@ -0,0 +1,193 @@
+import argparse
+import json
+import logging
+import re
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Local stand-in for the parts of the OpenAI Files and Batch APIs used by
+# llm_batch.BatchExecutor. Point a run at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stand-in python paraphrasing.py --batch
+# Every request is answered with a stub that satisfies its response_format
+# schema; --fail-every N turns every N-th request into a failed line.
+
+files = {}
+batches = {}
+
+
+def stub_from_schema(schema, defs=None):
+    """Build the simplest value that satisfies a JSON schema."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return stub_from_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        return stub_from_schema(schema["anyOf"][0], defs)
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {
+            name: stub_from_schema(prop, defs)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        return [stub_from_schema(schema.get("items", {}), defs)]
+    if schema_type == "boolean":
+        return True
+    if schema_type in ("integer", "number"):
+        return 0
+    return "stub"
+
+
+def answer(body):
+    """Build a chat completion for one batch request body."""
+    response_format = body.get("response_format")
+    if response_format and response_format.get("type") == "json_schema":
+        content = json.dumps(stub_from_schema(response_format["json_schema"]["schema"]))
+    else:
+        content = "Yes"
+    return {
+        "id": f"chatcmpl-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def new_file(content, purpose, filename):
+    file_id = f"file-{len(files) + 1}"
+    files[file_id] = {
+        "content": content,
+        "meta": {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        },
+    }
+    return files[file_id]["meta"]
+
+
+def run_batch(batch, fail_every):
+    """Answer every line of the batch input file and attach output and error files."""
+    lines = files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+    output, errors = [], []
+    for index, line in enumerate(line for line in lines if line.strip()):
+        request = json.loads(line)
+        if fail_every and (index + 1) % fail_every == 0:
+            errors.append({
+                "id": f"batch_req_{index}",
+                "custom_id": request["custom_id"],
+                "response": None,
+                "error": {"code": "server_error", "message": "stand-in failure"},
+            })
+            continue
+        output.append({
+            "id": f"batch_req_{index}",
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "request_id": str(index), "body": answer(request["body"])},
+            "error": None,
+        })
+    to_bytes = lambda records: "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+    batch["output_file_id"] = new_file(to_bytes(output), "batch_output", "output.jsonl")["id"] if output else None
+    batch["error_file_id"] = new_file(to_bytes(errors), "batch_output", "errors.jsonl")["id"] if errors else None
+    batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    fail_every = 0
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.path.endswith("/files"):
+            header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+            message = BytesParser(policy=HTTP).parsebytes(header + body)
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            upload = fields["file"]
+            self.send_json(new_file(
+                upload.get_payload(decode=True),
+                fields["purpose"].get_content().strip(),
+                upload.get_filename() or "input.jsonl",
+            ))
+        elif self.path.endswith("/batches"):
+            request = json.loads(body)
+            batch_id = f"batch_{len(batches) + 1}"
+            batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "metadata": request.get("metadata"),
+                "status": "in_progress",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": None,
+            }
+            self.send_json(batches[batch_id])
+        else:
+            self.send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+    def do_GET(self):
+        batch_match = re.search(r"/batches/([^/]+)$", self.path)
+        content_match = re.search(r"/files/([^/]+)/content$", self.path)
+        if batch_match and batch_match.group(1) in batches:
+            batch = batches[batch_match.group(1)]
+            # Batches complete on the first poll
+            if batch["status"] == "in_progress":
+                run_batch(batch, self.fail_every)
+            self.send_json(batch)
+        elif content_match and content_match.group(1) in files:
+            data = files[content_match.group(1)]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+    def log_message(self, format, *args):
+        logging.info(format % args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Batch API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-every", type=int, default=0, help="fail every N-th request")
+    args = parser.parse_args()
+
+    StandInHandler.fail_every = args.fail_every
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StandInHandler)
+    logging.info(f"Batch API stand-in listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,229 @@
+import argparse
+import itertools
+import json
+import logging
+import re
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Words that end in a period without ending the sentence (lowercase, without the period)
+ABBREVIATIONS = frozenset(
+    """
+    mr mrs ms dr prof sr jr st mt rev hon gen col lt capt sgt gov sen rep pres
+    inc ltd co corp llc plc bros dept univ assn est approx fig vol pp
+    vs etc al cf ca jan feb mar apr jun jul aug sep sept oct nov dec
+    """.split()
+)
+
+# Terminal punctuation with any closing quotes or brackets, then whitespace; or a line break
+BOUNDARY = re.compile(r"(?P<end>[.!?]+[\"'”’)\]]*)\s+|\s*\n\s*")
+# The word right before a boundary, e.g. "Dr" or "U.S"
+LAST_WORD = re.compile(r"[\w.&-]*\Z")
+# Dotted initialisms such as U.S, e.g and a.m
+INITIALISM = re.compile(r"(?:\w\.)+\w")
+CLOSERS = "\"'”’)]"
+# A sentence still open after this many characters is emitted anyway, so streaming memory stays bounded
+MAX_SENTENCE_CHARS = 100_000
+
+
+def is_boundary(text, match):
+    """Whether a BOUNDARY match really ends a sentence."""
+    terminal = match.group("end")
+    if terminal is None or "\n" in match.group():
+        return True
+    following = text[match.end() : match.end() + 1]
+    if following.islower():
+        return False
+    punctuation = terminal.rstrip(CLOSERS)
+    if punctuation.startswith(".."):
+        # An ellipsis continues the sentence
+        return False
+    if punctuation != ".":
+        return True
+    start = match.start()
+    word = LAST_WORD.search(text, max(0, start - 24), start).group().lower()
+    return not (
+        word in ABBREVIATIONS
+        or (len(word) == 1 and word.isalpha())
+        or INITIALISM.fullmatch(word)
+    )
+
+
+def split_sentences(text):
+    """Yield (start, end) character offsets of every sentence in text, whitespace trimmed."""
+    start = len(text) - len(text.lstrip())
+    for match in BOUNDARY.finditer(text, start):
+        if not is_boundary(text, match):
+            continue
+        end = match.end("end") if match.group("end") else match.start()
+        if end > start:
+            yield start, end
+        start = match.end()
+    end = len(text.rstrip())
+    if end > start:
+        yield start, end
+
+
+def split_windows(windows, max_sentence_chars=MAX_SENTENCE_CHARS):
+    """
+    Yield (sentence, (start, end)) for every sentence of a text that arrives
+    in consecutive windows, offsets counted from the start of the stream. The
+    last sentence of a window is held back until the next window shows where it
+    ends, so sentences crossing a window boundary come out whole.
+    """
+    carry = ""
+    # Offset of carry[0] in the stream
+    base = 0
+    for window in windows:
+        text = carry + window
+        spans = list(split_sentences(text))
+        if not spans:
+            carry = ""
+            base += len(text)
+            continue
+        held = spans.pop()
+        if len(text) - held[0] > max_sentence_chars:
+            spans.append(held)
+            keep = held[1]
+        else:
+            keep = held[0]
+        for start, end in spans:
+            yield text[start:end], (base + start, base + end)
+        carry = text[keep:]
+        base += keep
+    for start, end in split_sentences(carry):
+        yield carry[start:end], (base + start, base + end)
+
+
+def trimmed(text, start, end):
+    """Narrow (start, end) so the span neither starts nor ends with whitespace."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def article_texts(articles):
+    """(file_name, body_text) for every merged article with a body."""
+    return (
+        (file_name, article.get("body_text", ""))
+        for file_name, article in articles.items()
+        if article.get("body_text", "")
+    )
+
+
+class Chunker:
+    """
+    Common interface of the sentence chunkers. `split(text)` yields
+    (sentence, (start, end)) for one text; calling the chunker on
+    (file_name, text) pairs streams (article, sentence_idx, text, char_offsets).
+    """
+
+    def split(self, text):
+        raise NotImplementedError
+
+    def __call__(self, articles):
+        for file_name, text in articles:
+            for sentence_idx, (sentence, offsets) in enumerate(self.split(text)):
+                yield file_name, sentence_idx, sentence, offsets
+
+
+class RuleChunker(Chunker):
+    """Abbreviation-aware regular expression splitter; the default, with no model to load."""
+
+    def split(self, text):
+        for start, end in split_sentences(text):
+            yield text[start:end], (start, end)
+
+
+class SpacyChunker(Chunker):
+    """spaCy sentence boundaries, streamed through nlp.pipe."""
+
+    def __init__(self, fast=False, n_process=1, batch_size=64):
+        self.fast = fast
+        self.n_process = n_process
+        self.batch_size = batch_size
+
+    def sentences(self, doc):
+        for sent in doc.sents:
+            start, end = trimmed(doc.text, sent.start_char, sent.end_char)
+            if end > start:
+                yield doc.text[start:end], (start, end)
+
+    def split(self, text):
+        for _, _, sentence, offsets in self([(None, text)]):
+            yield sentence, offsets
+
+    def __call__(self, articles):
+        from chunking_spacy import sentence_docs
+
+        bodies = ((text, file_name) for file_name, text in articles)
+        for doc, file_name in sentence_docs(bodies, self.n_process, self.batch_size, self.fast):
+            for sentence_idx, (sentence, offsets) in enumerate(self.sentences(doc)):
+                yield file_name, sentence_idx, sentence, offsets
+
+
+# Model of FlairChunker; kept here so that naming it does not import Flair
+CHUNK_MODEL = "flair/chunk-english"
+
+
+class FlairChunker(Chunker):
+    """
+    Spans of the flair/chunk-english tagger. These are phrase chunks rather
+    than sentences, as chunking_flair.py has always produced.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def split(self, text):
+        from chunking_flair import chunk_spans_with_flair
+
+        yield from chunk_spans_with_flair(text, self.backend)
+
+
+# Model-based chunkers are opt-in; their modules are only imported when used
+CHUNKERS = {
+    "rules": RuleChunker,
+    "spacy": SpacyChunker,
+    "flair": FlairChunker,
+}
+
+
+def get_chunker(name="rules", **options):
+    return CHUNKERS[name](**options)
+
+
+def process_articles(input_file, output_file, chunker="rules"):
+    """Chunk merged articles into sentences, writing each article as it is done."""
+    with open(input_file, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+
+    logging.info(f"Chunking {len(articles)} articles with the {chunker} chunker")
+    chunks = get_chunker(chunker)(article_texts(articles))
+    count = 0
+    # The output is written as one JSON object, an article at a time
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("{")
+        for file_name, article_chunks in itertools.groupby(chunks, key=lambda chunk: chunk[0]):
+            f.write("," if count else "")
+            f.write(f"\n    {json.dumps(file_name, ensure_ascii=False)}: ")
+            f.write(json.dumps([chunk[2] for chunk in article_chunks], ensure_ascii=False))
+            count += 1
+        f.write("\n}\n")
+    logging.info(f"Successfully chunked {count} articles into {output_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk articles into sentences")
+    parser.add_argument("--chunker", choices=sorted(CHUNKERS), default="rules")
+    args = parser.parse_args()
+
+    input_file = "projects/prls/merged_articles.json"
+    output_file = f"projects/prls/chunked_articles_{args.chunker}.json"
+
+    process_articles(input_file, output_file, chunker=args.chunker)
@@ -1,40 +1,158 @@
+import argparse
 import json
-from openai import OpenAI
 from pathlib import Path
 import logging
-import time
-
-# Initialize OpenAI client
-client = OpenAI()
+from llm_cache import log_cache_stats
+from llm_executor import LLMExecutor
+from model_registry import get_spacy
+from stage_journal import StageJournal, journaled, request_fingerprint
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def check_chunk(chunk_text):
-    """Check if the chunk is a complete, grammatically correct sentence using GPT-4o-mini."""
+# Chunks with fewer words are fragments
+MIN_WORDS = 3
+# Longer chunks are likely run-ons and are left to the LLM
+MAX_WORDS = 60
+SUBJECT_DEPS = {"nsubj", "nsubjpass", "csubj", "csubjpass", "expl"}
+OPENERS = "\"'“‘("
+CLOSERS = "\"'”’)"
+
+def prescreen_chunk(doc):
+    """
+    Classify a parsed chunk without the LLM: "Yes" for a clear sentence, "No: <reason>"
+    for a clear fragment and None when the LLM has to decide.
+    """
+    text = doc.text.strip()
+    words = [token for token in doc if not token.is_punct and not token.is_space]
+    if len(words) < MIN_WORDS:
+        return "No: too short to be a sentence."
+    if not any(token.pos_ in ("VERB", "AUX") for token in words):
+        return "No: there is no verb."
+    roots = [token for token in doc if token.dep_ == "ROOT"]
+    first = text.lstrip(OPENERS)[:1]
+    if (
+        len(roots) == 1
+        and roots[0].pos_ in ("VERB", "AUX")
+        and any(child.dep_ in SUBJECT_DEPS for child in roots[0].children)
+        and text.rstrip(CLOSERS).endswith((".", "!", "?"))
+        and (first.isupper() or first.isdigit())
+        and len(words) <= MAX_WORDS
+    ):
+        return "Yes"
+    return None
+
+def prescreen_articles(chunked_articles, batch_size=64):
+    """Parse every chunk with spaCy and pre-screen it; returns {file_name: [verdict or None]}."""
+    nlp = get_spacy("en_core_web_sm")
+    verdicts = {file_name: [] for file_name in chunked_articles}
+    chunks = (
+        (chunk, file_name) for file_name, chunks in chunked_articles.items() for chunk in chunks
+    )
+    for doc, file_name in nlp.pipe(chunks, as_tuples=True, batch_size=batch_size):
+        verdicts[file_name].append(prescreen_chunk(doc))
+    return verdicts
+
+def is_yes(check_result):
+    """Read the pass/fail verdict off a check result."""
+    return check_result.strip().lstrip(OPENERS + "*").lower().startswith("yes")
+
+def check_chunk_request(chunk_text):
+    """Build the grammaticality check request for one chunk."""
     prompt = f"""
     You are a linguistics expert. For the provided text, determine if it is a complete, grammatically correct sentence. Respond with "Yes" or "No" and provide a brief explanation if the answer is "No".
 
     Text: "{chunk_text}"
     """
+    return {
+        "stage": "check_chunk",
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt},
+        ],
+    }
+
+async def check_chunk_async(executor, chunk_text):
+    """Check a chunk through the concurrent LLM executor; None if there was no answer."""
     try:
-        completion = client.beta.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt},
-            ],
-        )
-        if completion and completion.choices:
-            response = completion.choices[0].message.content.strip()
-            return response
-        else:
-            return "No response from GPT-4o-mini."
+        response = await executor.parse(**check_chunk_request(chunk_text))
+        if response:
+            return response.strip()
+        logging.error("No response from GPT-4o-mini.")
     except Exception as e:
         logging.error(f"Error checking chunk: {str(e)}")
-        return f"Error: {str(e)}"
+    return None
 
-def process_articles():
+async def check_article_chunk(executor, file_name, idx, chunks):
+    """Check one chunk of an article; None if the check failed, so it is not journaled."""
+    logging.info(f"Processing chunk {idx}/{len(chunks)} in article {file_name}")
+    chunk = chunks[idx - 1]
+    check_result = await check_chunk_async(executor, chunk)
+    if check_result is None:
+        return None
+    return {
+        "chunk": chunk,
+        "check_result": check_result,
+    }
+
+async def check_article_chunks(executor, file_name, chunks, journal=None, verdicts=None):
+    """
+    Check all chunks of an article concurrently, keeping their order. Chunks
+    with a pre-screen verdict keep it; only the others go to the LLM.
+    """
+    logging.info(f"Checking chunks for article: {file_name}")
+    verdicts = verdicts or [None] * len(chunks)
+    results = [
+        None if verdict is None else {"chunk": chunk, "check_result": verdict, "checked_by": "prescreen"}
+        for chunk, verdict in zip(chunks, verdicts)
+    ]
+    escalated = [idx for idx in range(1, len(chunks) + 1) if results[idx - 1] is None]
+    checked = await executor.run_in_order(
+        journaled(
+            journal,
+            request_fingerprint(check_chunk_request(chunks[idx - 1])),
+            check_article_chunk(executor, file_name, idx, chunks),
+        )
+        for idx in escalated
+    )
+    for idx, result in zip(escalated, checked):
+        # A failed check stays unanswered (check_result None) and is retried on the next run
+        result = result or {"chunk": chunks[idx - 1], "check_result": None}
+        results[idx - 1] = {**result, "checked_by": "llm"}
+    return results
+
+async def check_articles(executor, chunked_articles, journal=None, verdicts=None):
+    """Check the chunks of every article concurrently."""
+    verdicts = verdicts or {}
+    results = await executor.run_in_order(
+        check_article_chunks(executor, file_name, chunks, journal, verdicts.get(file_name))
+        for file_name, chunks in chunked_articles.items()
+    )
+    return dict(zip(chunked_articles, results))
+
+def log_agreement(verdicts, llm_checked):
+    """Log how often the pre-screen's passes and fails match the LLM's answer for the same chunks."""
+    counts = {"passes": [0, 0], "fails": [0, 0]}
+    for file_name, article_verdicts in verdicts.items():
+        for verdict, checked in zip(article_verdicts, llm_checked.get(file_name, [])):
+            # Chunks the LLM failed to answer say nothing about agreement
+            if verdict is None or checked["check_result"] is None:
+                continue
+            local = is_yes(verdict)
+            name = "passes" if local else "fails"
+            counts[name][0] += local == is_yes(checked["check_result"])
+            counts[name][1] += 1
+    for name, (agreed, total) in counts.items():
+        logging.info(
+            f"Pre-screen {name} agree with the LLM on {agreed}/{total} chunks"
+            f" ({agreed / total if total else 1.0:.1%})"
+        )
+    agreed = counts["passes"][0] + counts["fails"][0]
+    total = counts["passes"][1] + counts["fails"][1]
+    logging.info(f"Overall agreement {agreed}/{total} ({agreed / total if total else 1.0:.1%})")
+
+def process_articles(prescreen=True, compare=False):
     """Process chunked articles and check each chunk."""
     input_chunks = "data/chunked_articles_spacy.json"
     output_file = "data/chunked_articles_spacy_checked.json"
@@ -58,35 +176,39 @@ def process_articles():
         logging.error(f"Unexpected error loading {input_chunks}: {str(e)}")
         return
 
-    # Dictionary to store the results
-    checked_chunks = {}
-
-    # Iterate over each article
-    for file_name, chunks in chunked_articles.items():
-        logging.info(f"Checking chunks for article: {file_name}")
-        article_results = []
-
-        # Iterate over each chunk
-        for idx, chunk in enumerate(chunks, start=1):
-            logging.info(f"Processing chunk {idx}/{len(chunks)} in article {file_name}")
-            result = check_chunk(chunk)
-            article_results.append({
-                "chunk": chunk,
-                "check_result": result
-            })
-            time.sleep(1)
-            time.sleep(1)
+    verdicts = None
+    if prescreen or compare:
+        verdicts = prescreen_articles(chunked_articles)
+        total = sum(len(article_verdicts) for article_verdicts in verdicts.values())
+        escalated = sum(verdict is None for article_verdicts in verdicts.values() for verdict in article_verdicts)
+        logging.info(f"Pre-screen settled {total - escalated}/{total} chunks; {escalated} go to the LLM")
 
-        # Store the results for the article
-        checked_chunks[file_name] = article_results
+    # Check the remaining chunks; the executor enforces the rate limits
+    executor = LLMExecutor()
+    with StageJournal(output_file) as journal:
+        checked_chunks = executor.run(
+            check_articles(executor, chunked_articles, journal, verdicts if prescreen else None)
+        )
+        if compare:
+            llm_checked = (
+                checked_chunks if not prescreen else executor.run(check_articles(executor, chunked_articles, journal))
+            )
+            log_agreement(verdicts, llm_checked)
 
     # Save the checked chunks to a new JSON file
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(checked_chunks, f, indent=4, ensure_ascii=False)
+        journal.compact(checked_chunks)
         logging.info(f"Successfully checked chunks and saved results to {output_file}")
+        log_cache_stats()
     except Exception as e:
         logging.error(f"Error writing to {output_file}: {str(e)}")
 
 if __name__ == "__main__":
-    process_articles()
+    parser = argparse.ArgumentParser(description="Check that chunks are complete, grammatical sentences")
+    parser.add_argument("--no-prescreen", action="store_true", help="send every chunk to the LLM")
+    parser.add_argument(
+        "--compare", action="store_true", help="also check pre-screened chunks with the LLM and report agreement"
+    )
+    args = parser.parse_args()
+
+    process_articles(prescreen=not args.no_prescreen, compare=args.compare)
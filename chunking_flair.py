@@ -1,21 +1,27 @@
 import json
 import logging
 from flair.data import Sentence
-from flair.models import SequenceTagger
+from chunkers import CHUNK_MODEL
+from model_registry import get_flair_tagger
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-tagger = SequenceTagger.load("flair/chunk-english")
 
-def chunk_sentences_with_flair(article_text):
-    """Chunk article text into sentences using Flair."""
-    sentences = []
+def chunk_spans_with_flair(article_text, backend=None):
+    """Yield (chunk text, (start, end)) for every Flair chunk, with offsets into article_text."""
+    tagger = get_flair_tagger(CHUNK_MODEL, backend)
+    line_start = 0
     for line in article_text.split('\n'):
         if line.strip():  # Process non-empty lines
             sentence = Sentence(line)
             tagger.predict(sentence)
-            sentences.extend([span.text for span in sentence.get_spans("chunk")])
-    return sentences
+            for span in sentence.get_spans("chunk"):
+                yield span.text, (line_start + span.start_position, line_start + span.end_position)
+        line_start += len(line) + 1
+
+def chunk_sentences_with_flair(article_text, backend=None):
+    """Chunk article text into sentences using Flair."""
+    return [text for text, _ in chunk_spans_with_flair(article_text, backend)]
 
 def process_articles(input_file, output_file):
     """Process articles and chunk them into sentences using Flair."""
@@ -1,34 +1,74 @@
+import argparse
 import json
-import spacy
+from model_registry import get_spacy, get_spacy_sentencizer
+
+# Components that sentence segmentation with en_core_web_sm needs
+SENTENCE_COMPONENTS = {"tok2vec", "parser", "senter"}
+
 
 def chunk_sentences_with_spacy(article_text):
     """Chunk article text into sentences using spaCy."""
-    nlp = spacy.load("en_core_web_sm")
+    nlp = get_spacy("en_core_web_sm")
     doc = nlp(article_text)
     return [sent.text for sent in doc.sents]
 
-def process_articles(input_file, output_file):
-    """Process articles and chunk them into sentences using spaCy."""
-    with open(input_file, "r", encoding="utf-8") as f:
-        articles = json.load(f)
+def sentence_docs(bodies, n_process=1, batch_size=64, fast=False):
+    """
+    Stream (doc, file_name) for (text, file_name) pairs through nlp.pipe.
+    fast uses a blank pipeline with the rule-based sentencizer; otherwise
+    en_core_web_sm runs with every component not needed for sentences disabled.
+    """
+    if fast:
+        nlp = get_spacy_sentencizer("en")
+        disable = []
+    else:
+        nlp = get_spacy("en_core_web_sm")
+        disable = [name for name in nlp.pipe_names if name not in SENTENCE_COMPONENTS]
 
-    chunked_articles = {}
+    yield from nlp.pipe(
+        bodies, as_tuples=True, batch_size=batch_size, n_process=n_process, disable=disable
+    )
 
-    for file_name, article in list(articles.items())[:]:
-        article["body_text"] = article.get("body_text", "").split('\n')[:]
-        print(f"Chunking article with spaCy: {file_name}")
-        body_text = article.get("body_text", "")
+def chunk_articles_with_spacy(articles, n_process=1, batch_size=64, fast=False):
+    """Stream (file_name, sentences) for every article with a body through nlp.pipe."""
+    bodies = (
+        (article.get("body_text", ""), file_name)
+        for file_name, article in articles.items()
+        if article.get("body_text", "")
+    )
+    for doc, file_name in sentence_docs(bodies, n_process, batch_size, fast):
+        yield file_name, [sent.text.strip() for sent in doc.sents if sent.text.strip()]
 
-        if body_text:
-            sentences = chunk_sentences_with_spacy(body_text)
-            chunked_articles[file_name] = sentences
+def process_articles(input_file, output_file, n_process=1, batch_size=64, fast=False):
+    """Process articles and chunk them into sentences using spaCy, writing each article as it is done."""
+    with open(input_file, "r", encoding="utf-8") as f:
+        articles = json.load(f)
 
+    print(f"Chunking {len(articles)} articles with spaCy")
+    count = 0
+    # The output is written as one JSON object, an article at a time
     with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(chunked_articles, f, indent=4, ensure_ascii=False)
-    print(f"Successfully chunked articles into {output_file}")
+        f.write("{")
+        for file_name, sentences in chunk_articles_with_spacy(articles, n_process, batch_size, fast):
+            f.write("," if count else "")
+            f.write(f"\n    {json.dumps(file_name, ensure_ascii=False)}: ")
+            f.write(json.dumps(sentences, ensure_ascii=False))
+            count += 1
+            if count % 1000 == 0:
+                print(f"Chunked {count}/{len(articles)} articles")
+        f.write("\n}\n")
+    print(f"Successfully chunked {count} articles into {output_file}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk articles into sentences with spaCy")
+    parser.add_argument("--n-process", type=int, default=1, help="worker processes for nlp.pipe")
+    parser.add_argument("--batch-size", type=int, default=64, help="articles per nlp.pipe batch")
+    parser.add_argument("--fast", action="store_true", help="rule-based sentencizer only, no parser")
+    args = parser.parse_args()
+
     input_file = "projects/prls/merged_articles.json"
     output_file = "projects/prls/chunked_articles_spacy.json"
 
-    process_articles(input_file, output_file)
+    process_articles(
+        input_file, output_file, n_process=args.n_process, batch_size=args.batch_size, fast=args.fast
+    )
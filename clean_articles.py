@@ -1,12 +1,9 @@
 # import os
 import json
-from openai import OpenAI, completions
 from pathlib import Path
 from pydantic import BaseModel
-
-
-# Initialize OpenAI client
-client = OpenAI()
+from llm_cache import log_cache_stats
+from llm_executor import LLMExecutor
 
 
 class NewsArticle(BaseModel):
@@ -18,8 +15,8 @@ class NewsArticle(BaseModel):
     body_text: str
 
 
-def clean_article(html_content):
-    """Clean article using OpenAI API"""
+def clean_article_request(html_content):
+    """Build the article cleaning request for one HTML page"""
 
     extraction_prompt = """
         Objective: Extract the core content of a news article, including the title, publication date, publisher, author, and article body text. The extracted text should be exactly as it appears in the HTML, maintaining punctuation, spacing, and line breaks as they are.
@@ -161,27 +158,31 @@ def clean_article(html_content):
     #     By following this process, the extracted text will focus strictly on the article’s content, omitting unrelated HTML elements and ensuring that the information is captured precisely as it is in the original HTML.
     #     """
 
+    return {
+        "stage": "clean_article",
+        "model": "gpt-4o-mini",  # Using standard GPT-4 model
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that extracts clean article text from HTML.",
+            },
+            {
+                "role": "user",
+                "content": f"{extraction_prompt}\n\nHTML Content:\n{html_content}",
+            },
+        ],
+        "response_format": NewsArticle,
+    }
+
+
+async def clean_article_async(executor, html_content):
+    """Clean article through the concurrent LLM executor"""
     try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-mini",  # Using standard GPT-4 model
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that extracts clean article text from HTML.",
-                },
-                {
-                    "role": "user",
-                    "content": f"{extraction_prompt}\n\nHTML Content:\n{html_content}",
-                },
-            ],
-            response_format=NewsArticle,
-        )
+        event = await executor.parse(**clean_article_request(html_content))
 
-        if completion and completion.choices:
-            event = completion.choices[0].message.parsed
-            if event:
-                txt = json.dumps(event.dict(), indent=4)
-                return txt
+        if event:
+            txt = json.dumps(event.dict(), indent=4)
+            return txt
 
         print("No valid response received from OpenAI API")
         return None
@@ -191,33 +192,48 @@ def clean_article(html_content):
         return None
 
 
+async def clean_html_file(executor, html_file, output_path):
+    """Clean one HTML file and save the result"""
+    output_file = output_path / f"{html_file.stem}_cleaned.json"
+    # Each article is saved on its own, so a restarted run skips finished ones
+    if output_file.exists():
+        print(f"Skipping {html_file.name}, already cleaned")
+        return
+    print(f"Processing {html_file.name}")
+
+    # Read HTML content
+    with open(html_file, "r", encoding="utf-8") as f:
+        html_content = f.read()
+
+    # Clean article
+    cleaned_text = await clean_article_async(executor, html_content)
+
+    if cleaned_text:
+        # Save cleaned text
+        cleaned_data = {html_file.stem: json.loads(cleaned_text)}
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(cleaned_data, f, indent=4, ensure_ascii=False)
+        print(f"Saved cleaned text to {output_file}")
+    else:
+        print(f"Failed to clean {html_file.name}")
+
+
 def process_directory(input_dir, output_dir):
     """Process all HTML files in directory"""
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
 
-    # Process only first 2 articles using slice
-    for html_file in list(input_path.glob("*.html")):
-        # for html_file in list(input_path.glob("*.html"))[:5]:
-        print(f"Processing {html_file.name}")
-
-        # Read HTML content
-        with open(html_file, "r", encoding="utf-8") as f:
-            html_content = f.read()
-
-        # Clean article
-        cleaned_text = clean_article(html_content)
-
-        if cleaned_text:
-            # Save cleaned text
-            output_file = output_path / f"{html_file.stem}_cleaned.json"
-            cleaned_data = {html_file.stem: json.loads(cleaned_text)}
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(cleaned_data, f, indent=4, ensure_ascii=False)
-            print(f"Saved cleaned text to {output_file}")
-        else:
-            print(f"Failed to clean {html_file.name}")
+    html_files = list(input_path.glob("*.html"))
+    # html_files = list(input_path.glob("*.html"))[:5]
+    executor = LLMExecutor()
+    executor.run(
+        executor.run_in_order(
+            clean_html_file(executor, html_file, output_path) for html_file in html_files
+        )
+    )
+
+    log_cache_stats()
 
 
 if __name__ == "__main__":
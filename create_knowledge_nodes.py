@@ -1,3 +1,4 @@
+import argparse
 import json
 import logging
 from pathlib import Path
@@ -12,8 +13,37 @@ def load_json(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def create_knowledge_nodes():
-    """Create knowledge nodes from extracted information."""
+def create_node(sentence, entities, relationships, propositions, atomic_facts):
+    """Create the knowledge node of one sentence."""
+    return {
+        "sentence": sentence,
+        "entities": entities,
+        "relationships": relationships,
+        "propositions": propositions,
+        "atomic_facts": atomic_facts,
+    }
+
+def knowledge_nodes_from_store(store_file):
+    """Yield (file_name, knowledge nodes) per article from the Parquet stage store, reading only the node columns."""
+    from stage_store import iter_articles, triple_lists
+
+    columns = ["sentence", "entities", "relationships", "propositions", "atomic_facts"]
+    for file_name, rows in iter_articles(store_file, columns):
+        article_nodes = [
+            create_node(
+                row["sentence"],
+                row["entities"] or [],
+                triple_lists(row["relationships"] or []),
+                row["propositions"] or [],
+                row["atomic_facts"] or [],
+            )
+            for row in rows
+        ]
+        logging.info(f"Created {len(rows)} knowledge nodes for article: {file_name}")
+        yield file_name, article_nodes
+
+def knowledge_nodes_from_json():
+    """Yield (file_name, knowledge nodes) per article from the JSON stage outputs."""
     logging.info("Loading data files...")
     decontextualized_articles = load_json("projects/prls/decontextualized_articles.json")
     extracted_entities = load_json("projects/prls/extracted_entities.json")
@@ -21,8 +51,6 @@ def create_knowledge_nodes():
     extracted_propositions = load_json("projects/prls/extracted_propositions.json")
     extracted_atomic_facts = load_json("projects/prls/extracted_atomic_facts.json")
 
-    knowledge_graph = {}
-
     total_sentences = sum(len(sentences) for sentences in decontextualized_articles.values())
     processed_sentences = 0
 
@@ -37,24 +65,45 @@ def create_knowledge_nodes():
             propositions = extracted_propositions.get(file_name, [])[i]
             atomic_facts = extracted_atomic_facts.get(file_name, [])[i]
 
-            node = {
-                "sentence": sentence,
-                "entities": entities,
-                "relationships": relationships,
-                "propositions": propositions,
-                "atomic_facts": atomic_facts,
-            }
+            node = create_node(sentence, entities, relationships, propositions, atomic_facts)
             article_nodes.append(node)
 
-        knowledge_graph[file_name] = article_nodes
         logging.info(f"Created {len(article_nodes)} knowledge nodes for article: {file_name}")
         logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
+        yield file_name, article_nodes
 
+def create_knowledge_nodes(store_file=None, sqlite_file=None):
+    """Create knowledge nodes from extracted information."""
+    if store_file:
+        logging.info(f"Reading stage outputs from {store_file}")
+        articles = knowledge_nodes_from_store(store_file)
+    else:
+        articles = knowledge_nodes_from_json()
+
+    if sqlite_file:
+        # Articles stream into the database instead of being collected into one JSON object
+        from graph_store import write_graph_store
+
+        write_graph_store(sqlite_file, articles)
+        return
+
+    knowledge_graph = dict(articles)
     output_file = "projects/prls/knowledge_graph.json"
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(knowledge_graph, f, indent=4, ensure_ascii=False)
-    logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
     logging.info(f"Successfully created knowledge nodes in {output_file}")
 
 if __name__ == "__main__":
-    create_knowledge_nodes()
+    parser = argparse.ArgumentParser(description="Create knowledge nodes from the stage outputs")
+    parser.add_argument(
+        "--store", nargs="?", const="projects/prls/stage_outputs.parquet", help="read the Parquet stage store instead of the JSON files"
+    )
+    parser.add_argument(
+        "--sqlite",
+        nargs="?",
+        const="projects/prls/knowledge_graph.sqlite",
+        help="write the nodes into a SQLite graph store instead of knowledge_graph.json",
+    )
+    args = parser.parse_args()
+
+    create_knowledge_nodes(store_file=args.store, sqlite_file=args.sqlite)
@@ -1,27 +1,22 @@
+import argparse
 import json
 import logging
-import logging
-from openai import OpenAI
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 from pydantic import BaseModel
+from llm_cache import log_cache_stats
+from llm_batch import BatchExecutor
+from llm_executor import LLMExecutor
+from prompt_builder import PromptTemplate, fit_to_budget
+from stage_journal import StageJournal, journaled, request_fingerprint
 
-# Initialize OpenAI client
-client = OpenAI()
-
-
-class DecontextualizedSentence(BaseModel):
-    sentence: str
-
+# Token budget for the previous sentences given as context to each sentence
+CONTEXT_TOKEN_BUDGET = 300
 
-def decontextualize_sentences(
-    previous_sentences, current_sentence, num_previous_sentences=1000
-):
-    """Decontextualize a sentence using OpenAI API"""
-    prompt = """
+INSTRUCTIONS = """
     Instruction:
     Rewrite the below sentence by resolving all entity coreferences with the preceding sentences from the document.
     - Resolve all inter-sentence pronoun references.
@@ -31,37 +26,9 @@ def decontextualize_sentences(
     - Do not generate anything except the rewritten sentence.
     - Avoid pronouns or ambiguous references in facts and triplets. Instead, directly include all relevant named entities in facts.
 
-    ## Example 1:
+"""
 
-    ### Previous sentences from Document:
-    Elon Musk, the CEO of Tesla, highlighted the company's commitment to innovation and sustainability.
-    He announced that the new Tesla Model Z would set new standards in electric vehicles.
-
-    ### Current sentence:
-    He said it will be available for purchase early next year.
-
-    ### Output:
-    Elon Musk said the Tesla Model Z will be available for purchase early next year.
-
-    ---
-
-    ## Example 2:
-
-    ### Previous sentences from Document:
-    António Guterres, the UN Secretary-General, urged immediate action to combat global warming.
-    He emphasized the importance of global cooperation.
-
-    ### Current sentence:
-    He warned that delay could lead to irreversible damage.
-
-    ### Output:
-    António Guterres warned that delay in addressing climate change could lead to irreversible damage.
-
-    ---
-
-    """
-
-    examples = """
+EXAMPLES = """
     ## Example 1:
 
     ### Previous sentences from Document:
@@ -187,81 +154,206 @@ def decontextualize_sentences(
     The committee decided to propose an alternative plan.
     """
 
-    user_input = (
-        prompt
-        + examples
-        + "\n## Previous sentences\n"
-        + "\n".join(previous_sentences)
+DECONTEXTUALIZE_TEMPLATE = PromptTemplate(
+    "decontextualize_sentences",
+    system="You are a helpful assistant that follows instructions carefully. You will be given instructions, positive examples, negative examples with corrections, previous sentences, and current centence. Your jobe is to decontextualization the current sentence based on the previous sentences.",
+    prefix=INSTRUCTIONS + EXAMPLES,
+)
+
+
+class DecontextualizedSentence(BaseModel):
+    sentence: str
+
+
+def decontextualize_request(
+    previous_sentences, current_sentence, context_token_budget=CONTEXT_TOKEN_BUDGET
+):
+    """Build the decontextualization request, keeping as many previous sentences as fit the budget"""
+    context = fit_to_budget(
+        previous_sentences, context_token_budget, DECONTEXTUALIZE_TEMPLATE.model
+    )
+    suffix = (
+        "\n## Previous sentences\n"
+        + "\n".join(context)
         + "\n\n\n"
         + "\n## Current sentence\n"
         + current_sentence
     )
+    return DECONTEXTUALIZE_TEMPLATE.request(suffix, DecontextualizedSentence)
+
 
+async def decontextualize_sentences_async(
+    executor, previous_sentences, current_sentence, context_token_budget=CONTEXT_TOKEN_BUDGET
+):
+    """Decontextualize a sentence through the concurrent LLM executor"""
     try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that follows instructions carefully. You will be given instructions, positive examples, negative examples with corrections, previous sentences, and current centence. Your jobe is to decontextualization the current sentence based on the previous sentences.",
-                },
-                {"role": "user", "content": user_input},
-            ],
-            response_format=DecontextualizedSentence,
+        decontextualized = await executor.parse(
+            **decontextualize_request(
+                previous_sentences, current_sentence, context_token_budget
+            )
         )
 
-        if completion and completion.choices:
-            decontextualized = completion.choices[0].message.parsed
+        if decontextualized:
             return decontextualized
 
-        print("No valid response received from OpenAI API")
+        logging.warning("No valid response received from OpenAI API")
         return None
 
     except Exception as e:
-        print(f"Error decontextualizing sentence: {str(e)}")
+        logging.error(f"Error decontextualizing sentence: {str(e)}")
         return None
 
 
-def process_articles(input_file, output_file):
-    """Process articles and decontextualize sentences"""
-    with open(input_file, "r", encoding="utf-8") as f:
-        articles = json.load(f)
+async def decontextualize_sentence_text(executor, previous_sentences, current_sentence):
+    """Return the decontextualized text of a sentence, or None"""
+    decontextualized = await decontextualize_sentences_async(
+        executor, previous_sentences, current_sentence
+    )
+    return decontextualized.sentence if decontextualized else None
+
+
+async def decontextualize_article(executor, file_name, sentences, speculative=False, journal=None):
+    """
+    Decontextualize the sentences of one article.
+    In strict mode each sentence waits for its predecessors and uses their
+    decontextualized text as context. In speculative mode the raw previous
+    sentences are the context, so all sentences of the article run concurrently.
+    Returns one result per input sentence, None where decontextualization failed.
+    """
+    logging.info(f"Decontextualizing article: {file_name}")
+    if speculative:
+        results = await executor.run_in_order(
+            journaled(
+                journal,
+                request_fingerprint(decontextualize_request(sentences[:i], sentence)),
+                decontextualize_sentence_text(executor, sentences[:i], sentence),
+            )
+            for i, sentence in enumerate(sentences)
+        )
+        return results
+
+    results = []
+    decontextualized_sentences = []
+    for current_sentence in sentences:
+        decontextualized = await journaled(
+            journal,
+            request_fingerprint(decontextualize_request(decontextualized_sentences, current_sentence)),
+            decontextualize_sentence_text(executor, decontextualized_sentences, current_sentence),
+        )
+        results.append(decontextualized)
+        if decontextualized is not None:
+            decontextualized_sentences.append(decontextualized)
+    return results
 
-    decontextualized_articles = {}
 
-    num_previous_sentences = (
-        7  # Default value for the number of previous sentences to consider
+async def decontextualize_articles(executor, articles, speculative=False, journal=None):
+    """Decontextualize every article in its own lane, concurrently"""
+    results = await executor.run_in_order(
+        decontextualize_article(executor, file_name, sentences, speculative, journal)
+        for file_name, sentences in articles.items()
     )
+    return dict(zip(articles, results))
+
+
+def drop_failed(articles):
+    """Remove the sentences that failed to decontextualize."""
+    return {
+        file_name: [sentence for sentence in sentences if sentence is not None]
+        for file_name, sentences in articles.items()
+    }
+
+
+def divergence_report(strict_articles, speculative_articles):
+    """
+    Count sentences where speculative decontextualization differs from strict
+    mode. Both modes give one result per original sentence, so results are
+    compared by sentence index; a sentence that failed in only one mode diverges.
+    """
+    total = 0
+    diverged = 0
+    for file_name, strict_sentences in strict_articles.items():
+        speculative_sentences = speculative_articles.get(file_name, [])
+        for i, sentence in enumerate(strict_sentences):
+            total += 1
+            if i >= len(speculative_sentences) or speculative_sentences[i] != sentence:
+                diverged += 1
+    return {
+        "total_sentences": total,
+        "diverged_sentences": diverged,
+        "divergence": diverged / total if total else 0.0,
+    }
+
+
+def process_articles(input_file, output_file, speculative=False, compare=False, batch=False):
+    """Process articles and decontextualize sentences"""
+    if batch and (not speculative or compare):
+        # Strict mode submits one sentence at a time, and a batch can take up to 24h
+        raise ValueError("Batch mode needs --speculative and cannot be combined with --compare")
+
+    with open(input_file, "r", encoding="utf-8") as f:
+        articles = json.load(f)
 
     total_sentences = sum(len(sentences) for sentences in articles.values())
-    processed_sentences = 0
+    logging.info(
+        f"Decontextualizing {total_sentences} sentences in {len(articles)} articles"
+        + (" (speculative)" if speculative else "")
+    )
 
-    for file_name, sentences in articles.items():
-        logging.info(f"Decontextualizing article: {file_name}")
-        decontextualized_sentences = []
+    executor = BatchExecutor() if batch else LLMExecutor()
+    with StageJournal(output_file) as journal:
+        decontextualized_articles = executor.run(
+            decontextualize_articles(executor, articles, speculative, journal)
+        )
 
-        for i, current_sentence in enumerate(sentences[:]):
-            processed_sentences += 1
-            logging.info(
-                f"Processing {processed_sentences}/{total_sentences} sentences."
+        if compare:
+            # The other mode's answers for shared prompts come from the cache
+            other_articles = executor.run(
+                decontextualize_articles(executor, articles, not speculative, journal)
             )
-            previous_sentences = decontextualized_sentences[max(0, i - num_previous_sentences) : i]
-            decontextualized = decontextualize_sentences(
-                previous_sentences, current_sentence, num_previous_sentences
+            strict_articles, speculative_articles = (
+                (other_articles, decontextualized_articles)
+                if speculative
+                else (decontextualized_articles, other_articles)
+            )
+            report = divergence_report(strict_articles, speculative_articles)
+            logging.info(
+                f"Speculative mode differs from strict mode on {report['diverged_sentences']}/"
+                f"{report['total_sentences']} sentences ({report['divergence']:.1%})."
             )
-            if decontextualized:
-                decontextualized_sentences.append(decontextualized.sentence)
-
-        decontextualized_articles[file_name] = decontextualized_sentences
 
-    output_file = "projects/prls/decontextualized_articles.json"
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(decontextualized_articles, f, indent=4, ensure_ascii=False)
+    journal.compact(drop_failed(decontextualized_articles))
     logging.info(f"Successfully decontextualized articles into {output_file}")
+    log_cache_stats()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decontextualize chunked sentences")
+    parser.add_argument(
+        "--speculative",
+        action="store_true",
+        help="use the raw previous sentences as context so sentences of an article run concurrently",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="also run the other mode and log how often speculative and strict results differ",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="run through the OpenAI Batch API; needs --speculative, as strict mode would wait on one batch per sentence",
+    )
+    args = parser.parse_args()
+    if args.batch and (not args.speculative or args.compare):
+        parser.error("--batch needs --speculative and cannot be combined with --compare")
+
     input_file = "projects/prls/chunked_articles_flair.json"
     output_file = "projects/prls/decontextualized_articles.json"
 
-    process_articles(input_file, output_file)
+    process_articles(
+        input_file,
+        output_file,
+        speculative=args.speculative,
+        compare=args.compare,
+        batch=args.batch,
+    )
@@ -0,0 +1,211 @@
+import json
+import logging
+import re
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Flair (OntoNotes) and LLM entity types mapped onto coarse groups
+TYPE_GROUPS = {
+    "PERSON": "PERSON",
+    "PER": "PERSON",
+    "NORP": "GROUP",
+    "ORG": "ORG",
+    "LOC": "PLACE",
+    "GPE": "PLACE",
+    "FAC": "PLACE",
+    "DATE": "TIME",
+    "TIME": "TIME",
+    "MONEY": "VALUE",
+    "PERCENT": "VALUE",
+    "CARDINAL": "VALUE",
+    "ORDINAL": "VALUE",
+    "QUANTITY": "VALUE",
+}
+
+# Pairs of groups that never hold a relationship worth extracting.
+# Groups missing from TYPE_GROUPS (products, laws, works of art, new
+# LLM types, ...) are compatible with everything.
+INCOMPATIBLE_GROUPS = {
+    frozenset(["VALUE"]),
+    frozenset(["TIME"]),
+    frozenset(["TIME", "VALUE"]),
+}
+
+MAX_TOKEN_DISTANCE = 40
+
+TOKEN_PATTERN = re.compile(r"\w+")
+NORMALIZE_PATTERN = re.compile(r"^(the|a|an)\s+|['’]s$|[^\w\s]")
+
+
+def type_group(entity):
+    return TYPE_GROUPS.get(entity.get("type", "").upper(), entity.get("type", "").upper())
+
+
+def normalize_surface(entity):
+    """Normalize an entity name so that surface variants of one mention compare equal."""
+    text = entity["entity"].casefold().strip()
+    text = NORMALIZE_PATTERN.sub("", text)
+    return " ".join(text.split())
+
+
+def collapse_duplicates(entities):
+    """Keep the first of entities whose names normalize to the same surface form."""
+    seen = set()
+    unique = []
+    for entity in entities:
+        key = normalize_surface(entity)
+        if key not in seen:
+            seen.add(key)
+            unique.append(entity)
+    return unique
+
+
+def prune_mirrors(pairs, sentence):
+    """Keep one of (A, B) and (B, A); extraction reports the direction itself."""
+    seen = set()
+    kept = []
+    for entity1, entity2 in pairs:
+        key = frozenset([entity1["entity"], entity2["entity"]])
+        if key not in seen:
+            seen.add(key)
+            kept.append((entity1, entity2))
+    return kept
+
+
+def prune_incompatible_types(pairs, sentence):
+    """Drop pairs whose entity types cannot be related, e.g. DATE and PERCENT."""
+    return [
+        (entity1, entity2)
+        for entity1, entity2 in pairs
+        if frozenset([type_group(entity1), type_group(entity2)]) not in INCOMPATIBLE_GROUPS
+    ]
+
+
+def mention_token_span(entity, sentence):
+    """Return the (first, last) token positions of the entity in the sentence, or None."""
+    start = sentence.casefold().find(entity["entity"].casefold())
+    if start < 0:
+        return None
+    first = len(TOKEN_PATTERN.findall(sentence[:start]))
+    return first, first + max(len(TOKEN_PATTERN.findall(entity["entity"])), 1) - 1
+
+
+def prune_distant_mentions(pairs, sentence, max_distance=MAX_TOKEN_DISTANCE):
+    """Drop pairs whose mentions are more than max_distance tokens apart."""
+    kept = []
+    for entity1, entity2 in pairs:
+        span1 = mention_token_span(entity1, sentence)
+        span2 = mention_token_span(entity2, sentence)
+        if span1 and span2:
+            distance = max(span2[0] - span1[1], span1[0] - span2[1], 0)
+            if distance > max_distance:
+                continue
+        kept.append((entity1, entity2))
+    return kept
+
+
+# Pruners run in order; each takes (pairs, sentence) and returns the pairs to keep
+DEFAULT_PRUNERS = [prune_mirrors, prune_incompatible_types, prune_distant_mentions]
+
+
+def all_pairs(entities):
+    """All ordered pairs of different entities, as the pairwise prompts loop over them."""
+    return [
+        (entity1, entity2)
+        for entity1 in entities
+        for entity2 in entities
+        if entity1 != entity2
+    ]
+
+
+def candidate_pairs(entities, sentence, pruners=DEFAULT_PRUNERS):
+    """Collapse duplicate entities and return the pairs that survive every pruner."""
+    pairs = all_pairs(collapse_duplicates(entities))
+    for pruner in pruners:
+        pairs = pruner(pairs, sentence)
+    return pairs
+
+
+def pair_report(decontextualized_articles, extracted_entities, pruners=DEFAULT_PRUNERS):
+    """Count the entity pairs of every sentence before and after pruning, without a reference run."""
+    total_pairs = 0
+    kept_pairs = 0
+    for file_name, sentences in decontextualized_articles.items():
+        entities_list = extracted_entities.get(file_name, [])
+        for i, sentence in enumerate(sentences):
+            entities = entities_list[i] if i < len(entities_list) else []
+            total_pairs += len(all_pairs(entities))
+            kept_pairs += len(candidate_pairs(entities, sentence, pruners))
+    return {
+        "total_pairs": total_pairs,
+        "kept_pairs": kept_pairs,
+        "pruning_ratio": 1 - kept_pairs / total_pairs if total_pairs else 0.0,
+    }
+
+
+def pruning_report(decontextualized_articles, extracted_entities, extracted_relationships, pruners=DEFAULT_PRUNERS):
+    """
+    Compare pruned candidate pairs against an unpruned relation extraction run.
+    Recall is the fraction of the unpruned run's relationships whose entity
+    pair (in either direction) is still a candidate after pruning. Relationships
+    between names that are not entities of the sentence (e.g. from a run on an
+    older entities file) are counted separately and left out of the recall.
+    """
+    total_pairs = 0
+    kept_pairs = 0
+    total_relationships = 0
+    recalled_relationships = 0
+    unmatched_relationships = 0
+
+    for file_name, sentences in decontextualized_articles.items():
+        entities_list = extracted_entities.get(file_name, [])
+        relationships_list = extracted_relationships.get(file_name, [])
+        for i, sentence in enumerate(sentences):
+            entities = entities_list[i] if i < len(entities_list) else []
+            pairs = candidate_pairs(entities, sentence, pruners)
+            total_pairs += len(all_pairs(entities))
+            kept_pairs += len(pairs)
+
+            kept = {frozenset([e1["entity"], e2["entity"]]) for e1, e2 in pairs}
+            names = {entity["entity"] for entity in entities}
+            relationships = relationships_list[i] if i < len(relationships_list) else []
+            for entity1, relation, entity2 in relationships:
+                if entity1 not in names or entity2 not in names:
+                    unmatched_relationships += 1
+                    continue
+                total_relationships += 1
+                if frozenset([entity1, entity2]) in kept:
+                    recalled_relationships += 1
+
+    return {
+        "total_pairs": total_pairs,
+        "kept_pairs": kept_pairs,
+        "pruning_ratio": 1 - kept_pairs / total_pairs if total_pairs else 0.0,
+        "total_relationships": total_relationships,
+        "recalled_relationships": recalled_relationships,
+        "recall": recalled_relationships / total_relationships if total_relationships else 1.0,
+        "unmatched_relationships": unmatched_relationships,
+    }
+
+
+if __name__ == "__main__":
+    with open("projects/prls/decontextualized_articles.json", "r", encoding="utf-8") as f:
+        decontextualized_articles = json.load(f)
+    with open("projects/prls/extracted_entities.json", "r", encoding="utf-8") as f:
+        extracted_entities = json.load(f)
+    with open("projects/prls/extracted_relationships.json", "r", encoding="utf-8") as f:
+        extracted_relationships = json.load(f)
+
+    report = pruning_report(decontextualized_articles, extracted_entities, extracted_relationships)
+    logging.info(
+        f"Kept {report['kept_pairs']}/{report['total_pairs']} entity pairs "
+        f"(pruned {report['pruning_ratio']:.1%})."
+    )
+    logging.info(
+        f"Recall against the unpruned run: {report['recalled_relationships']}/{report['total_relationships']} "
+        f"relationships ({report['recall']:.1%}); {report['unmatched_relationships']} relationships "
+        f"name entities missing from extracted_entities.json."
+    )
@@ -0,0 +1,215 @@
+import argparse
+import hashlib
+import json
+import logging
+import re
+from array import array
+from collections import Counter, defaultdict
+from functools import lru_cache
+from operator import eq
+from entity_pair_pruning import type_group
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Tokens dropped before comparing names
+HONORIFICS = {"mr", "mrs", "ms", "dr", "prof", "sir", "dame", "lord", "lady", "sen", "gov", "rep"}
+COMPANY_SUFFIXES = {"inc", "ltd", "llc", "lp", "llp", "plc", "corp", "corporation", "co", "company", "gmbh", "ag", "sa"}
+LEADING_ARTICLES = {"the"}
+
+# MinHash signature length, split into LSH bands of BAND_ROWS rows
+NUM_PERM = 64
+BAND_ROWS = 4
+NGRAM = 3
+# Estimated Jaccard similarity of name n-grams above which two names of one type are merged
+SIMILARITY_THRESHOLD = 0.8
+# Tokens shared by more names than this are too common to block on
+MAX_BLOCK_SIZE = 200
+
+# Each salted 64-byte BLAKE2b digest gives 16 independent 32-bit hash values
+SALTS = [i.to_bytes(16, "little") for i in range(NUM_PERM // 16)]
+
+WORD = re.compile(r"\w+")
+
+
+def normalize(name):
+    """Lowercased name tokens without punctuation, honorifics, a leading "the" or company suffixes."""
+    # "L.P." and "U.S." become single tokens
+    tokens = WORD.findall(name.lower().replace(".", ""))
+    while tokens and (tokens[0] in HONORIFICS or tokens[0] in LEADING_ARTICLES):
+        tokens = tokens[1:]
+    while len(tokens) > 1 and tokens[-1] in COMPANY_SUFFIXES:
+        tokens = tokens[:-1]
+    return tuple(tokens)
+
+
+def shingles(tokens, n=NGRAM):
+    text = f" {' '.join(tokens)} "
+    return {text[i : i + n] for i in range(max(1, len(text) - n + 1))}
+
+
+@lru_cache(maxsize=1 << 16)
+def gram_hashes(gram):
+    """NUM_PERM hash values of one n-gram."""
+    data = gram.encode("utf-8")
+    values = array("I")
+    for salt in SALTS:
+        values.frombytes(hashlib.blake2b(data, digest_size=64, salt=salt).digest())
+    return values
+
+
+def minhash(grams):
+    """MinHash signature of a set of character n-grams."""
+    return tuple(map(min, zip(*(gram_hashes(gram) for gram in grams))))
+
+
+def similarity(signature1, signature2):
+    """Estimated Jaccard similarity of the n-gram sets behind two signatures."""
+    return sum(map(eq, signature1, signature2)) / NUM_PERM
+
+
+def types_agree(group1, group2):
+    """Type groups agree when equal or when either is unknown."""
+    return not group1 or not group2 or group1 == group2
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def count_mentions(extracted_entities):
+    """Count (name, type) mentions in {file_name: [[{"entity", "type"}]]}."""
+    mentions = Counter()
+    for sentences in extracted_entities.values():
+        for entities in sentences:
+            for entity in entities or []:
+                mentions[(entity["entity"], entity.get("type", ""))] += 1
+    return mentions
+
+
+def block_pairs(blocks):
+    """Every pair of indexes sharing a block, skipping blocks too common to be informative."""
+    pairs = set()
+    for members in blocks.values():
+        if 1 < len(members) <= MAX_BLOCK_SIZE:
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+
+def candidate_pairs(forms, signatures):
+    """
+    Pairs of form indexes with the same normalized tokens or sharing an LSH band
+    of their MinHash signatures. Each block is small, so this stays near-linear
+    in the forms.
+    """
+    blocks = defaultdict(list)
+    for i, (form, signature) in enumerate(zip(forms, signatures)):
+        blocks[form].append(i)
+        for band in range(0, NUM_PERM, BAND_ROWS):
+            blocks[(band, signature[band : band + BAND_ROWS])].append(i)
+    return block_pairs(blocks)
+
+
+def resolve_entities(mentions, threshold=SIMILARITY_THRESHOLD):
+    """
+    Cluster (name, type) mentions into canonical entities. Types are compared
+    by group, so Flair's PERSON/GPE agree with the LLM's PER/LOC. Names of agreeing
+    type merge when they normalize alike or their n-gram MinHash similarity
+    reaches the threshold; a one-word person name ("Musk") joins the one full
+    name ending in it, if only one does. Returns a list of
+    {"canonical", "type", "aliases", "mentions"}, most mentioned first.
+    """
+    keys = list(mentions)
+    forms = [normalize(name) for name, _ in keys]
+    groups = [type_group({"type": entity_type}) for _, entity_type in keys]
+    signatures = [minhash(shingles(tokens)) for tokens in forms]
+    clusters = UnionFind(len(keys))
+
+    for i, j in candidate_pairs(forms, signatures):
+        if not types_agree(groups[i], groups[j]) or not forms[i] or not forms[j]:
+            continue
+        if forms[i] == forms[j] or similarity(signatures[i], signatures[j]) >= threshold:
+            clusters.union(i, j)
+
+    # Surname blocking: full person names by their last token
+    surnames = defaultdict(list)
+    for i, (form, group) in enumerate(zip(forms, groups)):
+        if group == "PERSON" and len(form) > 1:
+            surnames[form[-1]].append(i)
+    for i, (form, group) in enumerate(zip(forms, groups)):
+        if group == "PERSON" and len(form) == 1:
+            full_names = surnames.get(form[0], [])
+            if len({forms[j] for j in full_names}) == 1:
+                for j in full_names:
+                    clusters.union(i, j)
+
+    members = defaultdict(list)
+    for i in range(len(keys)):
+        members[clusters.find(i)].append(keys[i])
+
+    entities = []
+    for cluster in members.values():
+        # The most mentioned name is canonical; the longer one on a tie
+        canonical = max(cluster, key=lambda key: (mentions[key], len(key[0])))
+        types = Counter()
+        for key in cluster:
+            types[key[1]] += mentions[key]
+        entities.append(
+            {
+                "canonical": canonical[0],
+                "type": types.most_common(1)[0][0],
+                "aliases": sorted({name for name, _ in cluster}),
+                "mentions": sum(mentions[key] for key in cluster),
+            }
+        )
+    entities.sort(key=lambda entity: -entity["mentions"])
+    return entities
+
+
+def alias_index(entities):
+    """{alias: canonical name} for every alias of every resolved entity, canonical names included."""
+    index = {}
+    for entity in entities:
+        for alias in entity["aliases"]:
+            # A name in several clusters (e.g. with different types) goes to the most mentioned one
+            index.setdefault(alias, entity["canonical"])
+    return index
+
+
+def load_aliases(path):
+    """Load the {alias: canonical} index written by this script."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["aliases"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge entity mentions across articles into canonical entities")
+    parser.add_argument("--input", default="projects/prls/extracted_entities.json")
+    parser.add_argument("--output", default="projects/prls/entity_aliases.json")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD, help="minimum estimated n-gram Jaccard")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        extracted_entities = json.load(f)
+
+    mentions = count_mentions(extracted_entities)
+    entities = resolve_entities(mentions, args.threshold)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"aliases": alias_index(entities), "entities": entities}, f, indent=4, ensure_ascii=False)
+    logging.info(f"Resolved {len(mentions)} distinct names into {len(entities)} entities in {args.output}")
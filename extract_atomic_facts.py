@@ -1,21 +1,24 @@
+import argparse
 import json
 import logging
-from openai import OpenAI
 from pydantic import BaseModel
+from llm_cache import log_cache_stats
+from llm_batch import BatchExecutor
+from llm_executor import LLMExecutor
+from stage_journal import StageJournal, journaled, request_fingerprint
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
-client = OpenAI()
 
 
 class AtomicFact(BaseModel):
     facts: list[str]
 
 
-def extract_atomic_facts(sentence, propositions):
-    """Extract atomic facts using OpenAI API"""
+def extract_atomic_facts_request(sentence, propositions):
+    """Build the atomic fact extraction request for one sentence"""
     prompt = (
         f"Instructions:\n\n"
         f"1. Carefully analyze the sentence and the provided propositions.\n"
@@ -29,25 +32,32 @@ def extract_atomic_facts(sentence, propositions):
         f"Propositions: {propositions}\n"
     )
 
+    return {
+        "stage": "extract_atomic_facts",
+        # "model": "gpt-4o",
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that extracts atomic facts from given sentences.",
+            },
+            {
+                "role": "user",
+                "content": prompt,
+            },
+        ],
+        "response_format": AtomicFact,
+    }
+
+
+async def extract_atomic_facts_async(executor, sentence, propositions):
+    """Extract atomic facts through the concurrent LLM executor"""
     try:
-        completion = client.beta.chat.completions.parse(
-            # model="gpt-4o",
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that extracts atomic facts from given sentences.",
-                },
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-            ],
-            response_format=AtomicFact,
+        atomic_facts = await executor.parse(
+            **extract_atomic_facts_request(sentence, propositions)
         )
 
-        if completion and completion.choices:
-            atomic_facts = completion.choices[0].message.parsed
+        if atomic_facts:
             return atomic_facts
 
         logging.warning("No valid response received from OpenAI API")
@@ -58,7 +68,69 @@ def extract_atomic_facts(sentence, propositions):
         return None
 
 
-def process_articles():
+async def extract_sentence_atomic_facts(
+    executor, file_name, sentence_index, sentences_list, propositions_list
+):
+    """Extract atomic facts for the sentence at sentence_index of an article; None if the request failed"""
+    propositions = (
+        propositions_list[sentence_index]
+        if sentence_index < len(propositions_list)
+        else []
+    )
+    logging.info(
+        f"Extracting atomic facts for sentence {sentence_index + 1}/{len(sentences_list)} in article: {file_name}"
+    )
+    atomic_facts = await extract_atomic_facts_async(
+        executor, sentences_list[sentence_index], propositions
+    )
+    if atomic_facts is None:
+        return None
+    logging.info(f"Extracted {len(atomic_facts.facts)} atomic facts for sentence {sentence_index + 1}.")
+    return atomic_facts.facts
+
+
+async def extract_article_atomic_facts(
+    executor, file_name, sentences_list, propositions_list, journal=None
+):
+    """Extract atomic facts for all sentences of an article, keeping their order"""
+    logging.info(f"Processing article: {file_name}")
+    article_atomic_facts = await executor.run_in_order(
+        journaled(
+            journal,
+            request_fingerprint(
+                extract_atomic_facts_request(
+                    sentences_list[sentence_index],
+                    propositions_list[sentence_index]
+                    if sentence_index < len(propositions_list)
+                    else [],
+                )
+            ),
+            extract_sentence_atomic_facts(
+                executor, file_name, sentence_index, sentences_list, propositions_list
+            ),
+        )
+        for sentence_index in range(len(sentences_list))
+    )
+    # Failed sentences are not journaled; they get no facts in this run's output
+    article_atomic_facts = [facts if facts is not None else [] for facts in article_atomic_facts]
+    logging.info(f"Extracted atomic facts for {len(article_atomic_facts)} sentences in article: {file_name}")
+    return article_atomic_facts
+
+
+async def extract_articles_atomic_facts(
+    executor, decontextualized_articles, extracted_propositions, journal=None
+):
+    """Extract atomic facts for every article concurrently"""
+    results = await executor.run_in_order(
+        extract_article_atomic_facts(
+            executor, file_name, sentences_list, extracted_propositions.get(file_name, []), journal
+        )
+        for file_name, sentences_list in decontextualized_articles.items()
+    )
+    return dict(zip(decontextualized_articles, results))
+
+
+def process_articles(batch=False):
     """Process articles and extract atomic facts"""
     logging.info(
         "Loading decontextualized articles from projects/prls/decontextualized_articles.json"
@@ -85,45 +157,29 @@ def process_articles():
     with open("projects/prls/extracted_propositions.json", "r", encoding="utf-8") as f:
         extracted_propositions = json.load(f)
 
-    all_atomic_facts = {}
-
-    total_sentences = sum(len(sentences) for sentences in decontextualized_articles.values())
-    processed_sentences = 0
-    total_atomic_facts = 0
-
-    for file_name, sentences_list in decontextualized_articles.items():
-        processed_sentences += len(sentences_list)
-        logging.info(f"Processing article: {file_name}")
-        propositions_list = extracted_propositions.get(file_name, [])
-
-        article_atomic_facts = [[] for _ in sentences_list]
-
-        for sentence_index, sentence in enumerate(sentences_list):
-            propositions = (
-                propositions_list[sentence_index]
-                if sentence_index < len(propositions_list)
-                else []
+    executor = BatchExecutor() if batch else LLMExecutor()
+    with StageJournal("projects/prls/extracted_atomic_facts.json") as journal:
+        all_atomic_facts = executor.run(
+            extract_articles_atomic_facts(
+                executor, decontextualized_articles, extracted_propositions, journal
             )
-            logging.info(
-                f"Extracting atomic facts for sentence {sentence_index + 1}/{len(sentences_list)} in article: {file_name}"
-            )
-            atomic_facts = extract_atomic_facts(sentence, propositions)
-            if atomic_facts:
-                facts_count = len(atomic_facts.facts)
-                article_atomic_facts[sentence_index].extend(atomic_facts.facts)
-                total_atomic_facts += facts_count
-                logging.info(f"Extracted {facts_count} atomic facts for sentence {sentence_index + 1}.")
-
-        all_atomic_facts[file_name] = article_atomic_facts
-        logging.info(f"Extracted atomic facts for {len(article_atomic_facts)} sentences in article: {file_name}")
-        logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
-
-    with open("projects/prls/extracted_atomic_facts.json", "w", encoding="utf-8") as f:
-        json.dump(all_atomic_facts, f, indent=4, ensure_ascii=False)
+        )
+    total_atomic_facts = sum(
+        len(facts) for article_facts in all_atomic_facts.values() for facts in article_facts
+    )
+    logging.info(f"Processed {total_sentences}/{total_sentences} sentences.")
+    logging.info(f"Extracted {total_atomic_facts} atomic facts.")
+
+    journal.compact(all_atomic_facts)
     logging.info(
         "Successfully extracted atomic facts into projects/prls/extracted_atomic_facts.json"
     )
+    log_cache_stats()
 
 
 if __name__ == "__main__":
-    process_articles()
+    parser = argparse.ArgumentParser(description="Extract atomic facts")
+    parser.add_argument("--batch", action="store_true", help="run through the OpenAI Batch API")
+    args = parser.parse_args()
+
+    process_articles(batch=args.batch)
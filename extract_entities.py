@@ -1,12 +1,13 @@
 import json
 import logging
-from openai import OpenAI
 from pydantic import BaseModel
 from pathlib import Path
+from llm_cache import log_cache_stats
+from llm_executor import LLMExecutor
+from stage_journal import StageJournal, journaled, request_fingerprint
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-client = OpenAI()
 
 
 class NamedEntity(BaseModel):
@@ -18,8 +19,8 @@ class NamedEntities(BaseModel):
     entities: list[NamedEntity]
 
 
-def extract_entities_from_article(article_text):
-    """Extract named entities using OpenAI API"""
+def extract_entities_request(article_text):
+    """Build the entity extraction request for one sentence"""
     common_ner_types = """
     <common_ner>
     Commonly Used Entity Types:
@@ -39,24 +40,29 @@ def extract_entities_from_article(article_text):
         Language (LANGUAGE): Names of languages.
     </common_ner>
     """
+    return {
+        "stage": "extract_entities_from_article",
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that extracts named entities from text.",
+            },
+            {
+                "role": "user",
+                "content": f"Read the article text carfully. Extract named entities from the following article text:\n\n<article_text>{article_text}</article_text>\n\n use the short form of common NER types but also add new ones when you need to. {common_ner_types}",
+            },
+        ],
+        "response_format": NamedEntities,
+    }
+
+
+async def extract_entities_from_article_async(executor, article_text):
+    """Extract named entities through the concurrent LLM executor"""
     try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that extracts named entities from text.",
-                },
-                {
-                    "role": "user",
-                    "content": f"Read the article text carfully. Extract named entities from the following article text:\n\n<article_text>{article_text}</article_text>\n\n use the short form of common NER types but also add new ones when you need to. {common_ner_types}",
-                },
-            ],
-            response_format=NamedEntities,
-        )
+        entities = await executor.parse(**extract_entities_request(article_text))
 
-        if completion and completion.choices:
-            entities = completion.choices[0].message.parsed
+        if entities:
             return entities
 
         print("No valid response received from OpenAI API")
@@ -67,31 +73,50 @@ def extract_entities_from_article(article_text):
         return None
 
 
+async def extract_sentence_entities(executor, file_name, i, sentences_list):
+    """Extract named entities from the i-th sentence of an article"""
+    logging.info(f"Extracting entities from sentence {i+1}/{len(sentences_list)} in article: {file_name}")
+    entities = await extract_entities_from_article_async(executor, sentences_list[i])
+    if not entities:
+        return None
+    return [{"entity": entity.entity, "type": entity.type} for entity in entities.entities]
+
+
+async def extract_article_entities(executor, file_name, sentences_list, journal=None):
+    """Extract named entities from all sentences of an article, keeping their order"""
+    print(f"Extracting entities from article: {file_name}")
+    results = await executor.run_in_order(
+        journaled(
+            journal,
+            request_fingerprint(extract_entities_request(sentences_list[i])),
+            extract_sentence_entities(executor, file_name, i, sentences_list),
+        )
+        for i in range(len(sentences_list))
+    )
+    return [entities for entities in results if entities is not None]
+
+
+async def extract_articles_entities(executor, articles, journal=None):
+    """Extract named entities from every article concurrently"""
+    results = await executor.run_in_order(
+        extract_article_entities(executor, file_name, sentences_list, journal)
+        for file_name, sentences_list in articles.items()
+    )
+    return dict(zip(articles, results))
+
+
 def process_articles(input_file, output_file):
     """Process articles and extract named entities"""
     with open(input_file, "r", encoding="utf-8") as f:
         articles = json.load(f)
 
-    extracted_entities = {}
-
-    for file_name, sentences_list in list(articles.items())[:]:
-        sentences_list = sentences_list[:]
-        print(f"Extracting entities from article: {file_name}")
-        sentence_entities = []
-
-        for i, sentence in enumerate(sentences_list):
-            logging.info(f"Extracting entities from sentence {i+1}/{len(sentences_list)} in article: {file_name}")
-            entities = extract_entities_from_article(sentence)
-            if entities:
-                sentence_entities.append([
-                    {"entity": entity.entity, "type": entity.type} for entity in entities.entities
-                ])
-
-        extracted_entities[file_name] = sentence_entities
+    executor = LLMExecutor()
+    with StageJournal(output_file) as journal:
+        extracted_entities = executor.run(extract_articles_entities(executor, articles, journal))
 
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(extracted_entities, f, indent=4, ensure_ascii=False)
+    journal.compact(extracted_entities)
     print(f"Successfully extracted entities into {output_file}")
+    log_cache_stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+import argparse
+import json
+import logging
+from extract_entities_flair import NER_MODEL, spans_to_entities
+from flair_batching import MINI_BATCH_SIZE
+from flair_pool import predict_articles
+from link_entities_flair import LINKER_MODEL, spans_to_linked_entities
+from relation_extraction_flair import RELATION_MODELS, sentence_relations
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Applied in this order. The relation model reads the CoNLL "ner" spans; the
+# OntoNotes tagger then replaces them with its own for the entity output,
+# leaving the relation labels already on the sentence in place
+ANNOTATION_MODELS = (*RELATION_MODELS, NER_MODEL, LINKER_MODEL)
+
+
+def annotate_sentence(sentence):
+    """Read entities, linked entities and relations off a sentence annotated by all models"""
+    return (
+        spans_to_entities(sentence),
+        spans_to_linked_entities(sentence),
+        sentence_relations(sentence),
+    )
+
+
+def process_articles(input_file, output_files, mini_batch_size=MINI_BATCH_SIZE, workers=1):
+    """
+    Tokenize every sentence once and run NER, entity linking and relation
+    tagging on the same Sentence, writing one output file per task.
+    """
+    with open(input_file, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+
+    total_sentences = sum(len(sentences) for sentences in articles.values())
+    logging.info(f"Annotating {total_sentences} sentences with {', '.join(ANNOTATION_MODELS)}")
+    annotations = predict_articles(
+        ANNOTATION_MODELS, articles, annotate_sentence, workers=workers, mini_batch_size=mini_batch_size
+    )
+
+    for task, output_file in enumerate(output_files):
+        results = {
+            file_name: [annotation[task] for annotation in article_annotations]
+            for file_name, article_annotations in annotations.items()
+        }
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        logging.info(f"Saved {output_file}")
+    logging.info(f"Processed {total_sentences}/{total_sentences} sentences.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Annotate sentences with Flair NER, linking and relations in one pass")
+    parser.add_argument("--mini-batch-size", type=int, default=MINI_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, each with its own models")
+    args = parser.parse_args()
+
+    input_file = "projects/prls/decontextualized_articles.json"
+    output_files = (
+        "projects/prls/extracted_entities.json",
+        "projects/prls/extracted_linked_entities.json",
+        "projects/prls/flair_relations.json",
+    )
+
+    process_articles(input_file, output_files, mini_batch_size=args.mini_batch_size, workers=args.workers)
@@ -0,0 +1,88 @@
+import argparse
+import json
+import logging
+import os
+import time
+from flair.data import Sentence
+from model_registry import get_flair, log_load_times
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+MINI_BATCH_SIZE = int(os.environ.get("KGB_FLAIR_MINI_BATCH_SIZE", "32"))
+
+
+def flatten_articles(articles):
+    """Flatten {file_name: [sentence, ...]} into parallel lists of (file_name, index) keys and texts."""
+    keys = []
+    texts = []
+    for file_name, sentences_list in articles.items():
+        for i, text in enumerate(sentences_list):
+            keys.append((file_name, i))
+            texts.append(text)
+    return keys, texts
+
+
+def regroup(articles, keys, results):
+    """Put per-sentence results back into the {file_name: [result, ...]} layout of articles."""
+    grouped = {file_name: [None] * len(sentences_list) for file_name, sentences_list in articles.items()}
+    for (file_name, i), result in zip(keys, results):
+        grouped[file_name][i] = result
+    return grouped
+
+
+def predict_batched(model, texts, mini_batch_size=MINI_BATCH_SIZE):
+    """
+    Run a Flair model, or a list of models in sequence, over many texts in
+    length-sorted mini-batches. Each text is tokenized into one Sentence that
+    every model annotates. Sorting keeps padding inside each batch small.
+    Returns the predicted Sentence objects in the order of texts.
+    """
+    models = model if isinstance(model, (list, tuple)) else [model]
+    sentences = [Sentence(text) for text in texts]
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]), reverse=True)
+    for start in range(0, len(order), mini_batch_size):
+        batch = [sentences[i] for i in order[start : start + mini_batch_size] if len(sentences[i])]
+        if batch:
+            for model in models:
+                model.predict(batch, mini_batch_size=mini_batch_size)
+        logging.info(f"Predicted {min(start + mini_batch_size, len(order))}/{len(order)} sentences")
+    return sentences
+
+
+def benchmark(model, texts, mini_batch_size=MINI_BATCH_SIZE):
+    """Return sentences/sec for one-sentence-at-a-time prediction and for predict_batched."""
+    started = time.perf_counter()
+    for text in texts:
+        sentence = Sentence(text)
+        if len(sentence):
+            model.predict(sentence)
+    one_by_one = len(texts) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    predict_batched(model, texts, mini_batch_size)
+    batched = len(texts) / (time.perf_counter() - started)
+    return one_by_one, batched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batched Flair inference")
+    parser.add_argument("--model", default="ner-ontonotes-large", help="Flair model, e.g. ner-ontonotes-large, linker, relations")
+    parser.add_argument("--input", default="projects/prls/decontextualized_articles.json")
+    parser.add_argument("--limit", type=int, default=200, help="number of sentences to time")
+    parser.add_argument("--mini-batch-size", type=int, default=MINI_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+    texts = flatten_articles(articles)[1][: args.limit]
+
+    model = get_flair(args.model)
+    log_load_times()
+    one_by_one, batched = benchmark(model, texts, args.mini_batch_size)
+    logging.info(
+        f"{args.model} on {len(texts)} sentences: {one_by_one:.1f} sentences/sec one at a time, "
+        f"{batched:.1f} sentences/sec in mini-batches of {args.mini_batch_size} ({batched / one_by_one:.1f}x)"
+    )
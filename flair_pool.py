@@ -0,0 +1,100 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from flair_batching import MINI_BATCH_SIZE, flatten_articles, predict_batched, regroup
+from model_registry import get_flair
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Shards per worker; more than one evens out shards that happen to be slow
+SHARDS_PER_WORKER = int(os.environ.get("KGB_FLAIR_SHARDS_PER_WORKER", "4"))
+
+
+def shard_texts(texts, shards):
+    """Split texts into at most `shards` contiguous, near-equal chunks, in order."""
+    size, extra = divmod(len(texts), shards)
+    chunks = []
+    start = 0
+    for shard in range(shards):
+        end = start + size + (shard < extra)
+        if end > start:
+            chunks.append(texts[start:end])
+        start = end
+    return chunks
+
+
+def load_models(model_name):
+    """Load one Flair model, or a list of models for a single pass over each sentence."""
+    if isinstance(model_name, (list, tuple)):
+        return [get_flair(name) for name in model_name]
+    return get_flair(model_name)
+
+
+def init_worker(model_name, torch_threads):
+    """Pin the torch thread count and load the model once per worker process."""
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    load_models(model_name)
+
+
+def predict_shard(texts, model_name, read_sentence, mini_batch_size):
+    """Predict a shard of sentences in mini-batches and read each result back, in order."""
+    sentences = predict_batched(load_models(model_name), texts, mini_batch_size)
+    return [read_sentence(sentence) for sentence in sentences]
+
+
+def predict_articles(
+    model_name,
+    articles,
+    read_sentence,
+    workers=1,
+    mini_batch_size=MINI_BATCH_SIZE,
+    shards_per_worker=SHARDS_PER_WORKER,
+    torch_threads=None,
+):
+    """
+    Run a Flair model over {file_name: sentences} and return {file_name: results}.
+    model_name may be a list of models, which then annotate each sentence in turn.
+    read_sentence turns a predicted Sentence into the per-sentence result and
+    must be a module-level function so it can be sent to worker processes.
+    With workers > 1 the sentences of all articles are flattened and split into
+    near-equal shards that a pool of worker processes handles, each with its own
+    model and torch_threads threads (by default the cores divided among the
+    workers), so even a single long article is spread over every worker. The
+    results are put back per article, in sentence order.
+    """
+    keys, texts = flatten_articles(articles)
+    if workers <= 1:
+        return regroup(articles, keys, predict_shard(texts, model_name, read_sentence, mini_batch_size))
+
+    torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    shards = shard_texts(texts, workers * shards_per_worker)
+    logging.info(
+        f"Predicting {len(texts)} sentences of {len(articles)} articles with {model_name} "
+        f"in {len(shards)} shards on {workers} workers x {torch_threads} torch threads"
+    )
+    results = []
+    # spawn keeps the workers clear of torch state inherited from the parent
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(model_name, torch_threads),
+    ) as pool:
+        shard_results = pool.map(
+            predict_shard,
+            shards,
+            [model_name] * len(shards),
+            [read_sentence] * len(shards),
+            [mini_batch_size] * len(shards),
+        )
+        # map yields in submission order, so the results line up with keys
+        for done, shard_result in enumerate(shard_results, start=1):
+            results.extend(shard_result)
+            logging.info(f"Merged shard {done}/{len(shards)}")
+    return regroup(articles, keys, results)
@@ -0,0 +1,302 @@
+import argparse
+import json
+import logging
+import sys
+from array import array
+from entity_resolution import load_aliases
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+MAGIC = b"KGBGRAPH2\n"
+# Typecodes of IDs and of offsets into ID arrays
+ID = "I"
+OFFSET = "Q"
+
+# String tables and arrays of a saved graph, in file order
+STRING_TABLES = ("entities", "entity_types", "relations", "articles", "sentences")
+ARRAYS = (
+    "sentence_article",
+    "sentence_index",
+    "out_offsets",
+    "out_targets",
+    "out_relations",
+    "out_sentences",
+    "in_offsets",
+    "in_sources",
+    "in_relations",
+    "in_sentences",
+    "in_edges",
+    "mention_offsets",
+    "mention_sentences",
+)
+
+
+def csr(count, keys, *columns):
+    """
+    Group the rows of `columns` by `keys` (IDs below count) with a counting sort.
+    Returns offsets, where the rows of key k are [offsets[k], offsets[k + 1]),
+    and the grouped columns.
+    """
+    offsets = array(OFFSET, [0]) * (count + 1)
+    for key in keys:
+        offsets[key + 1] += 1
+    for key in range(count):
+        offsets[key + 1] += offsets[key]
+    position = offsets[:-1]
+    grouped = [array(column.typecode, [0]) * len(keys) for column in columns]
+    for row, key in enumerate(keys):
+        slot = position[key]
+        position[key] += 1
+        for target, column in zip(grouped, columns):
+            target[slot] = column[row]
+    return offsets, grouped
+
+
+def pack_strings(strings):
+    """Encode strings as one UTF-8 blob plus the offset of every string in it."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = array(OFFSET, [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return b"".join(encoded), offsets
+
+
+def unpack_strings(blob, offsets):
+    return [blob[offsets[i] : offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+class KnowledgeGraph:
+    """
+    Entities and relation labels as integer IDs, with edges in CSR arrays:
+    the outgoing edges of entity e are rows out_offsets[e]..out_offsets[e + 1]
+    of out_targets / out_relations / out_sentences, and likewise for incoming
+    edges and for the sentences mentioning e. Every edge points back to the
+    sentence it was extracted from; in_edges gives the outgoing row of each
+    incoming edge, so both directions share one edge ID.
+    """
+
+    def __init__(self, strings, arrays):
+        for name in STRING_TABLES:
+            setattr(self, name, strings[name])
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.entity_ids = {name: i for i, name in enumerate(self.entities)}
+        self.relation_ids = {label: i for i, label in enumerate(self.relations)}
+
+    def entity_id(self, name):
+        return self.entity_ids.get(name)
+
+    def outgoing(self, entity):
+        """(relation, target, sentence_id) for every edge leaving an entity."""
+        e = self.entity_ids[entity] if isinstance(entity, str) else entity
+        return [
+            (self.out_relations[row], self.out_targets[row], self.out_sentences[row])
+            for row in range(self.out_offsets[e], self.out_offsets[e + 1])
+        ]
+
+    def incoming(self, entity):
+        """(relation, source, sentence_id) for every edge entering an entity."""
+        e = self.entity_ids[entity] if isinstance(entity, str) else entity
+        return [
+            (self.in_relations[row], self.in_sources[row], self.in_sentences[row])
+            for row in range(self.in_offsets[e], self.in_offsets[e + 1])
+        ]
+
+    def mentions(self, entity):
+        """IDs of the sentences mentioning an entity."""
+        e = self.entity_ids[entity] if isinstance(entity, str) else entity
+        return self.mention_sentences[self.mention_offsets[e] : self.mention_offsets[e + 1]]
+
+    def sentence(self, sentence_id):
+        """(file_name, sentence index in the article, text) of a sentence ID."""
+        return (
+            self.articles[self.sentence_article[sentence_id]],
+            self.sentence_index[sentence_id],
+            self.sentences[sentence_id],
+        )
+
+    def triples(self):
+        """Yield (entity1, relation, entity2, sentence_id) for every edge, by source entity."""
+        for e, name in enumerate(self.entities):
+            for relation, target, sentence_id in self.outgoing(e):
+                yield name, self.relations[relation], self.entities[target], sentence_id
+
+    def save(self, path):
+        """
+        Write the graph as MAGIC, a one-line JSON header with the typecode and
+        length of every array, then the raw bytes of each array in header order.
+        """
+        blobs = {}
+        arrays = {}
+        for name in STRING_TABLES:
+            blobs[name], arrays[f"{name}_offsets"] = pack_strings(getattr(self, name))
+        for name in ARRAYS:
+            arrays[name] = getattr(self, name)
+        header = {
+            "byteorder": sys.byteorder,
+            "blobs": {name: len(blob) for name, blob in blobs.items()},
+            "arrays": {name: [values.typecode, len(values)] for name, values in arrays.items()},
+        }
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for blob in blobs.values():
+                f.write(blob)
+            for values in arrays.values():
+                values.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            if f.readline() != MAGIC:
+                raise ValueError(f"{path} is not a knowledge graph file")
+            header = json.loads(f.readline())
+            blobs = {name: f.read(size) for name, size in header["blobs"].items()}
+            arrays = {}
+            for name, (typecode, length) in header["arrays"].items():
+                values = array(typecode)
+                values.fromfile(f, length)
+                if header["byteorder"] != sys.byteorder:
+                    values.byteswap()
+                arrays[name] = values
+        strings = {name: unpack_strings(blobs[name], arrays.pop(f"{name}_offsets")) for name in STRING_TABLES}
+        return cls(strings, arrays)
+
+
+class GraphBuilder:
+    """
+    Interns entities and relation labels while sentences are added, then lays
+    the edges out as CSR. With an {alias: canonical} index every mention is
+    recorded under its canonical entity.
+    """
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases or {}
+        self.entities = []
+        self.entity_types = []
+        self.entity_ids = {}
+        self.relations = []
+        self.relation_ids = {}
+        self.articles = []
+        self.article_ids = {}
+        self.sentences = []
+        self.sentence_article = array(ID)
+        self.sentence_index = array(ID)
+        self.edge_sources = array(ID)
+        self.edge_targets = array(ID)
+        self.edge_relations = array(ID)
+        self.edge_sentences = array(ID)
+        self.mention_entities = array(ID)
+        self.mention_sentences = array(ID)
+
+    def entity(self, name, entity_type=""):
+        name = self.aliases.get(name, name)
+        e = self.entity_ids.get(name)
+        if e is None:
+            e = self.entity_ids[name] = len(self.entities)
+            self.entities.append(name)
+            self.entity_types.append(entity_type or "")
+        elif entity_type and not self.entity_types[e]:
+            self.entity_types[e] = entity_type
+        return e
+
+    def relation(self, label):
+        r = self.relation_ids.get(label)
+        if r is None:
+            r = self.relation_ids[label] = len(self.relations)
+            self.relations.append(label)
+        return r
+
+    def add_node(self, file_name, index, node):
+        """Add one knowledge node (a sentence with its entities and relationships)."""
+        article = self.article_ids.get(file_name)
+        if article is None:
+            article = self.article_ids[file_name] = len(self.articles)
+            self.articles.append(file_name)
+        sentence_id = len(self.sentences)
+        self.sentences.append(node["sentence"])
+        self.sentence_article.append(article)
+        self.sentence_index.append(index)
+
+        mentioned = set()
+        for entity in node.get("entities", []):
+            e = self.entity(entity["entity"], entity.get("type", ""))
+            if e not in mentioned:
+                mentioned.add(e)
+                self.mention_entities.append(e)
+                self.mention_sentences.append(sentence_id)
+        # The same triple from another sentence is another edge, with its own provenance
+        edges = set()
+        for entity1, relation, entity2 in node.get("relationships", []):
+            edge = (self.entity(entity1), self.relation(relation), self.entity(entity2))
+            if edge in edges:
+                continue
+            edges.add(edge)
+            self.edge_sources.append(edge[0])
+            self.edge_relations.append(edge[1])
+            self.edge_targets.append(edge[2])
+            self.edge_sentences.append(sentence_id)
+        return sentence_id
+
+    def build(self):
+        count = len(self.entities)
+        edges = array(ID, range(len(self.edge_sources)))
+        out_offsets, (out_targets, out_relations, out_sentences, out_edges) = csr(
+            count, self.edge_sources, self.edge_targets, self.edge_relations, self.edge_sentences, edges
+        )
+        # Outgoing row of every edge, in insertion order
+        out_rows = array(ID, [0]) * len(edges)
+        for row, edge in enumerate(out_edges):
+            out_rows[edge] = row
+        in_offsets, (in_sources, in_relations, in_sentences, in_edges) = csr(
+            count, self.edge_targets, self.edge_sources, self.edge_relations, self.edge_sentences, out_rows
+        )
+        mention_offsets, (mention_sentences,) = csr(count, self.mention_entities, self.mention_sentences)
+        strings = {name: getattr(self, name) for name in STRING_TABLES}
+        arrays = {
+            "sentence_article": self.sentence_article,
+            "sentence_index": self.sentence_index,
+            "out_offsets": out_offsets,
+            "out_targets": out_targets,
+            "out_relations": out_relations,
+            "out_sentences": out_sentences,
+            "in_offsets": in_offsets,
+            "in_sources": in_sources,
+            "in_relations": in_relations,
+            "in_sentences": in_sentences,
+            "in_edges": in_edges,
+            "mention_offsets": mention_offsets,
+            "mention_sentences": mention_sentences,
+        }
+        return KnowledgeGraph(strings, arrays)
+
+
+def build_graph(knowledge_graph, aliases=None):
+    """Build the entity/edge graph from {file_name: [knowledge node]}."""
+    builder = GraphBuilder(aliases)
+    for file_name, nodes in knowledge_graph.items():
+        for index, node in enumerate(nodes):
+            builder.add_node(file_name, index, node)
+    return builder.build()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the entity/relation graph from the knowledge nodes")
+    parser.add_argument("--input", default="projects/prls/knowledge_graph.json")
+    parser.add_argument("--output", default="projects/prls/knowledge_graph.kgb")
+    parser.add_argument("--aliases", help="alias index from entity_resolution.py, e.g. projects/prls/entity_aliases.json")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        knowledge_graph = json.load(f)
+
+    aliases = load_aliases(args.aliases) if args.aliases else None
+    graph = build_graph(knowledge_graph, aliases)
+    graph.save(args.output)
+    logging.info(
+        f"Saved {len(graph.entities)} entities, {len(graph.relations)} relation labels, "
+        f"{len(graph.out_targets)} edges and {len(graph.sentences)} sentences to {args.output}"
+    )
@@ -0,0 +1,259 @@
+import argparse
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Articles written per transaction
+BATCH_ARTICLES = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    file_name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sentences (
+    id INTEGER PRIMARY KEY,
+    article_id INTEGER NOT NULL REFERENCES articles (id),
+    sentence_idx INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (article_id, sentence_idx)
+);
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS mentions (
+    entity_id INTEGER NOT NULL REFERENCES entities (id),
+    sentence_id INTEGER NOT NULL REFERENCES sentences (id),
+    PRIMARY KEY (entity_id, sentence_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS triples (
+    id INTEGER PRIMARY KEY,
+    sentence_id INTEGER NOT NULL REFERENCES sentences (id),
+    subject_id INTEGER NOT NULL REFERENCES entities (id),
+    relation TEXT NOT NULL,
+    object_id INTEGER NOT NULL REFERENCES entities (id)
+);
+CREATE TABLE IF NOT EXISTS propositions (
+    id INTEGER PRIMARY KEY,
+    sentence_id INTEGER NOT NULL REFERENCES sentences (id),
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS atomic_facts (
+    id INTEGER PRIMARY KEY,
+    sentence_id INTEGER NOT NULL REFERENCES sentences (id),
+    text TEXT NOT NULL
+);
+-- Sentence, proposition and atomic fact text; kind says which, sentence_id where it came from
+CREATE VIRTUAL TABLE IF NOT EXISTS text_search USING fts5 (
+    text, kind UNINDEXED, sentence_id UNINDEXED
+);
+"""
+
+# Created after the bulk load, which is faster than maintaining them row by row
+INDEXES = """
+CREATE INDEX IF NOT EXISTS mentions_sentence ON mentions (sentence_id);
+CREATE INDEX IF NOT EXISTS entities_type ON entities (type);
+CREATE INDEX IF NOT EXISTS triples_subject ON triples (subject_id, relation);
+CREATE INDEX IF NOT EXISTS triples_object ON triples (object_id, relation);
+CREATE INDEX IF NOT EXISTS triples_relation ON triples (relation);
+CREATE INDEX IF NOT EXISTS triples_sentence ON triples (sentence_id);
+CREATE INDEX IF NOT EXISTS propositions_sentence ON propositions (sentence_id);
+CREATE INDEX IF NOT EXISTS atomic_facts_sentence ON atomic_facts (sentence_id);
+"""
+
+
+class GraphStore:
+    """Knowledge nodes in normalized SQLite tables, with FTS5 over sentence, proposition and fact text."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.entity_ids = dict(self.conn.execute("SELECT name, id FROM entities"))
+        self.typed_entities = {
+            row[0] for row in self.conn.execute("SELECT id FROM entities WHERE type != ''")
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def entity(self, name, entity_type=""):
+        """ID of an entity, inserting it on first sight; a later type fills in a missing one."""
+        entity_id = self.entity_ids.get(name)
+        if entity_id is None:
+            entity_id = self.conn.execute(
+                "INSERT INTO entities (name, type) VALUES (?, ?)", (name, entity_type or "")
+            ).lastrowid
+            self.entity_ids[name] = entity_id
+        elif entity_type and entity_id not in self.typed_entities:
+            self.conn.execute("UPDATE entities SET type = ? WHERE id = ?", (entity_type, entity_id))
+        if entity_type:
+            self.typed_entities.add(entity_id)
+        return entity_id
+
+    def add_article(self, file_name, nodes):
+        """Insert an article's knowledge nodes."""
+        conn = self.conn
+        article_id = conn.execute("INSERT INTO articles (file_name) VALUES (?)", (file_name,)).lastrowid
+
+        mentions, triples, propositions, atomic_facts, texts = [], [], [], [], []
+        for index, node in enumerate(nodes):
+            sentence_id = conn.execute(
+                "INSERT INTO sentences (article_id, sentence_idx, text) VALUES (?, ?, ?)",
+                (article_id, index, node["sentence"]),
+            ).lastrowid
+            texts.append((node["sentence"], "sentence", sentence_id))
+            for entity in node.get("entities", []):
+                mentions.append((self.entity(entity["entity"], entity.get("type", "")), sentence_id))
+            for entity1, relation, entity2 in node.get("relationships", []):
+                triples.append((sentence_id, self.entity(entity1), relation, self.entity(entity2)))
+            for proposition in node.get("propositions", []):
+                propositions.append((sentence_id, proposition))
+                texts.append((proposition, "proposition", sentence_id))
+            for fact in node.get("atomic_facts", []):
+                atomic_facts.append((sentence_id, fact))
+                texts.append((fact, "atomic_fact", sentence_id))
+
+        conn.executemany("INSERT OR IGNORE INTO mentions (entity_id, sentence_id) VALUES (?, ?)", mentions)
+        conn.executemany(
+            "INSERT INTO triples (sentence_id, subject_id, relation, object_id) VALUES (?, ?, ?, ?)", triples
+        )
+        conn.executemany("INSERT INTO propositions (sentence_id, text) VALUES (?, ?)", propositions)
+        conn.executemany("INSERT INTO atomic_facts (sentence_id, text) VALUES (?, ?)", atomic_facts)
+        conn.executemany("INSERT INTO text_search (text, kind, sentence_id) VALUES (?, ?, ?)", texts)
+
+    def write_articles(self, articles, batch_articles=BATCH_ARTICLES):
+        """Insert (file_name, nodes) pairs, committing a transaction every batch_articles articles."""
+        count = 0
+        self.conn.execute("BEGIN")
+        try:
+            for file_name, nodes in articles:
+                self.add_article(file_name, nodes)
+                count += 1
+                if count % batch_articles == 0:
+                    self.conn.execute("COMMIT")
+                    logging.info(f"Stored {count} articles")
+                    self.conn.execute("BEGIN")
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.executescript(INDEXES)
+        self.conn.execute("ANALYZE")
+        return count
+
+    def search(self, query, kind=None, limit=20, syntax=False):
+        """
+        Full-text search; returns (kind, file_name, sentence_idx, text) by relevance.
+        Every word of the query must match, as a literal term; with syntax the
+        query is passed to FTS5 as is (AND/OR/NEAR, prefix*, column filters).
+        """
+        if not syntax:
+            query = fts_terms(query)
+        sql = """
+            SELECT text_search.kind, articles.file_name, sentences.sentence_idx, text_search.text
+            FROM text_search
+            JOIN sentences ON sentences.id = text_search.sentence_id
+            JOIN articles ON articles.id = sentences.article_id
+            WHERE text_search MATCH ?
+        """
+        parameters = [query]
+        if kind:
+            sql += " AND text_search.kind = ?"
+            parameters.append(kind)
+        sql += " ORDER BY rank LIMIT ?"
+        parameters.append(limit)
+        return self.conn.execute(sql, parameters).fetchall()
+
+    def entity_sentences(self, name):
+        """(file_name, sentence_idx, text) of every sentence mentioning an entity."""
+        return self.conn.execute(
+            """
+            SELECT articles.file_name, sentences.sentence_idx, sentences.text
+            FROM entities
+            JOIN mentions ON mentions.entity_id = entities.id
+            JOIN sentences ON sentences.id = mentions.sentence_id
+            JOIN articles ON articles.id = sentences.article_id
+            WHERE entities.name = ?
+            ORDER BY sentences.id
+            """,
+            (name,),
+        ).fetchall()
+
+    def entity_triples(self, name):
+        """(subject, relation, object, sentence) of every triple with the entity on either side."""
+        return self.conn.execute(
+            """
+            SELECT subject.name, triples.relation, object.name, sentences.text
+            FROM entities AS entity
+            JOIN triples ON triples.subject_id = entity.id OR triples.object_id = entity.id
+            JOIN entities AS subject ON subject.id = triples.subject_id
+            JOIN entities AS object ON object.id = triples.object_id
+            JOIN sentences ON sentences.id = triples.sentence_id
+            WHERE entity.name = ?
+            ORDER BY triples.id
+            """,
+            (name,),
+        ).fetchall()
+
+
+def fts_terms(query):
+    """Quote every word of a query as an FTS5 string, so "OpenAI-Microsoft" is text, not syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def write_graph_store(path, articles):
+    """Write (file_name, nodes) pairs into a new SQLite graph store at path."""
+    path = Path(path)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    with GraphStore(path) as store:
+        count = store.write_articles(articles)
+    logging.info(f"Successfully stored {count} articles in {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the SQLite knowledge graph store")
+    parser.add_argument("--db", default="projects/prls/knowledge_graph.sqlite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = commands.add_parser("search", help="full-text search over sentences, propositions and facts")
+    search_parser.add_argument("query", help="words that must all appear, e.g. 'OpenAI lawsuit'")
+    search_parser.add_argument("--syntax", action="store_true", help="treat the query as FTS5 syntax, e.g. 'lawsuit OR suit'")
+    search_parser.add_argument("--kind", choices=["sentence", "proposition", "atomic_fact"])
+    search_parser.add_argument("--limit", type=int, default=20)
+
+    entity_parser = commands.add_parser("entity", help="sentences and triples of an entity")
+    entity_parser.add_argument("name")
+    args = parser.parse_args()
+
+    with GraphStore(args.db) as store:
+        started = time.perf_counter()
+        if args.command == "search":
+            try:
+                results = store.search(args.query, args.kind, args.limit, args.syntax)
+            except sqlite3.OperationalError as e:
+                parser.error(f"invalid FTS5 query {args.query!r}: {e}")
+            for kind, file_name, sentence_idx, text in results:
+                print(f"[{kind}] {file_name}#{sentence_idx}: {text}")
+        else:
+            for file_name, sentence_idx, text in store.entity_sentences(args.name):
+                print(f"{file_name}#{sentence_idx}: {text}")
+            for subject, relation, obj, _ in store.entity_triples(args.name):
+                print(f"({subject}) -[{relation}]-> ({obj})")
+        logging.info(f"Query took {(time.perf_counter() - started) * 1000:.2f} ms")
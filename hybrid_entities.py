@@ -0,0 +1,143 @@
+import argparse
+import json
+import logging
+from extract_entities import extract_entities_request, extract_sentence_entities
+from extract_entities_flair import NER_MODEL
+from flair_batching import MINI_BATCH_SIZE
+from flair_pool import predict_articles
+from llm_cache import log_cache_stats
+from llm_executor import LLMExecutor
+from stage_journal import StageJournal, journaled, request_fingerprint
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Flair spans are kept when every label of the sentence scores at least this
+CONFIDENCE_THRESHOLD = 0.9
+
+# Flair OntoNotes labels and long-form LLM labels mapped onto the short tags of
+# the extraction prompt, so both sources write one tag set
+ENTITY_TYPES = {
+    "PERSON": "PER",
+    "ORGANIZATION": "ORG",
+    "LOCATION": "LOC",
+    "FACILITY": "FAC",
+    "PRODUCT": "PROD",
+    "EVENT": "EVT",
+    "WORK_OF_ART": "WOA",
+    "WORK OF ART": "WOA",
+    "PERCENTAGE": "PERCENT",
+}
+
+
+def entity_type(label):
+    label = label.strip().upper()
+    return ENTITY_TYPES.get(label, label)
+
+
+def with_entity_types(entities):
+    return [{"entity": entity["entity"], "type": entity_type(entity["type"])} for entity in entities]
+
+
+def spans_with_scores(sentence):
+    """Read named entities and their label confidence off a predicted Flair sentence"""
+    return [
+        {
+            "entity": entity.text,
+            "type": entity_type(entity.get_label("ner").value),
+            "score": entity.get_label("ner").score,
+        }
+        for entity in sentence.get_spans("ner")
+    ]
+
+
+def is_confident(spans, threshold=CONFIDENCE_THRESHOLD):
+    """A sentence needs the LLM when Flair found nothing or any span is below the threshold."""
+    return bool(spans) and min(span["score"] for span in spans) >= threshold
+
+
+def without_scores(spans):
+    return [{"entity": span["entity"], "type": span["type"]} for span in spans]
+
+
+async def hybrid_sentence_entities(executor, file_name, i, sentences_list, spans, threshold, journal=None):
+    """Keep confident Flair entities; otherwise ask the LLM, falling back to Flair if that fails"""
+    if is_confident(spans, threshold):
+        return without_scores(spans)
+    entities = await journaled(
+        journal,
+        request_fingerprint(extract_entities_request(sentences_list[i])),
+        extract_sentence_entities(executor, file_name, i, sentences_list),
+    )
+    return with_entity_types(entities) if entities is not None else without_scores(spans)
+
+
+async def hybrid_articles_entities(executor, articles, flair_spans, threshold, journal=None):
+    """Extract entities for every sentence of every article, escalating to the LLM where needed"""
+    results = await executor.run_in_order(
+        executor.run_in_order(
+            hybrid_sentence_entities(
+                executor, file_name, i, sentences_list, flair_spans[file_name][i], threshold, journal
+            )
+            for i in range(len(sentences_list))
+        )
+        for file_name, sentences_list in articles.items()
+    )
+    return dict(zip(articles, results))
+
+
+def process_articles(
+    input_file, output_file, threshold=CONFIDENCE_THRESHOLD, mini_batch_size=MINI_BATCH_SIZE, workers=1
+):
+    """Run Flair NER on every sentence and the LLM only on empty or low-confidence sentences"""
+    with open(input_file, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+
+    total_sentences = sum(len(sentences) for sentences in articles.values())
+    logging.info(f"Tagging {total_sentences} sentences with {NER_MODEL}")
+    flair_spans = predict_articles(
+        NER_MODEL, articles, spans_with_scores, workers=workers, mini_batch_size=mini_batch_size
+    )
+    escalated = sum(
+        not is_confident(spans, threshold)
+        for article_spans in flair_spans.values()
+        for spans in article_spans
+    )
+    logging.info(
+        f"Escalating {escalated}/{total_sentences} sentences to the LLM (confidence threshold {threshold})"
+    )
+
+    executor = LLMExecutor()
+    with StageJournal(output_file) as journal:
+        extracted_entities = executor.run(
+            hybrid_articles_entities(executor, articles, flair_spans, threshold, journal)
+        )
+
+    journal.compact(extracted_entities)
+    avoided = total_sentences - escalated
+    logging.info(
+        f"{avoided}/{total_sentences} sentences ({avoided / total_sentences if total_sentences else 0:.1%}) "
+        f"avoided an API call"
+    )
+    log_cache_stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract named entities with Flair, using the LLM only when needed")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD, help="minimum Flair label confidence")
+    parser.add_argument("--mini-batch-size", type=int, default=MINI_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for Flair")
+    args = parser.parse_args()
+
+    input_file = "projects/prls/decontextualized_articles.json"
+    output_file = "projects/prls/extracted_entities.json"
+
+    process_articles(
+        input_file,
+        output_file,
+        threshold=args.threshold,
+        mini_batch_size=args.mini_batch_size,
+        workers=args.workers,
+    )
@@ -0,0 +1,219 @@
+import argparse
+import json
+import logging
+import time
+from array import array
+from collections import defaultdict
+from entity_resolution import load_aliases
+from graph_builder import ID, KnowledgeGraph, build_graph
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class GraphQuery:
+    """
+    Lookups over a KnowledgeGraph. The graph's CSR arrays already index
+    entity -> outgoing and incoming edges and entity -> sentences; on load this
+    adds relation -> edges and type -> entities, plus case-insensitive and
+    alias name lookup. Edges are identified by their outgoing row.
+    """
+
+    def __init__(self, graph, aliases=None):
+        self.graph = graph
+        # Alias keys are lowercased, so alias lookup is case-insensitive too
+        self.aliases = {}
+        for alias, canonical in (aliases or {}).items():
+            self.aliases.setdefault(alias.lower(), canonical)
+        self.lowercase_ids = {}
+        for e, name in enumerate(graph.entities):
+            self.lowercase_ids.setdefault(name.lower(), e)
+        # Source entity of every outgoing edge row
+        self.edge_sources = array(ID, [0]) * len(graph.out_targets)
+        self.relation_rows = defaultdict(lambda: array(ID))
+        for e in range(len(graph.entities)):
+            for row in range(graph.out_offsets[e], graph.out_offsets[e + 1]):
+                self.edge_sources[row] = e
+                self.relation_rows[graph.out_relations[row]].append(row)
+        self.type_entities = defaultdict(list)
+        for e, entity_type in enumerate(graph.entity_types):
+            self.type_entities[entity_type].append(e)
+
+    @classmethod
+    def load(cls, path, aliases=None):
+        """Load a saved .kgb graph, or build one from knowledge_graph.json."""
+        if str(path).endswith(".kgb"):
+            graph = KnowledgeGraph.load(path)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                graph = build_graph(json.load(f), aliases)
+        return cls(graph, aliases)
+
+    def entity_id(self, name):
+        """ID of an entity by name, alias or case-insensitive name; None if unknown."""
+        name = self.aliases.get(name.lower(), name)
+        e = self.graph.entity_id(name)
+        return e if e is not None else self.lowercase_ids.get(name.lower())
+
+    def entity(self, name):
+        """Type and mentioning sentences of an entity."""
+        e = self.entity_id(name)
+        if e is None:
+            return None
+        return {
+            "entity": self.graph.entities[e],
+            "type": self.graph.entity_types[e],
+            "sentences": [self.graph.sentence(s) for s in self.graph.mentions(e)],
+        }
+
+    def entities_of_type(self, entity_type):
+        return [self.graph.entities[e] for e in self.type_entities.get(entity_type, [])]
+
+    def incoming(self, e):
+        """Outgoing rows of the edges entering an entity."""
+        graph = self.graph
+        return graph.in_edges[graph.in_offsets[e] : graph.in_offsets[e + 1]]
+
+    def edge(self, row):
+        graph = self.graph
+        return {
+            "subject": graph.entities[self.edge_sources[row]],
+            "relation": graph.relations[graph.out_relations[row]],
+            "object": graph.entities[graph.out_targets[row]],
+            "sentence": graph.sentences[graph.out_sentences[row]],
+        }
+
+    def triples(self, subject=None, relation=None, object=None, subject_type=None, object_type=None):
+        """
+        Triples matching a pattern; None matches anything. Candidates come from
+        the most selective index available: the subject's outgoing edges, the
+        object's incoming edges, the relation's edges, or else every edge.
+        """
+        graph = self.graph
+        subject_id = object_id = relation_id = None
+        if subject is not None:
+            subject_id = self.entity_id(subject)
+            if subject_id is None:
+                return []
+        if object is not None:
+            object_id = self.entity_id(object)
+            if object_id is None:
+                return []
+        if relation is not None:
+            relation_id = graph.relation_ids.get(relation)
+            if relation_id is None:
+                return []
+
+        if subject_id is not None:
+            rows = range(graph.out_offsets[subject_id], graph.out_offsets[subject_id + 1])
+        elif object_id is not None:
+            rows = self.incoming(object_id)
+        elif relation_id is not None:
+            rows = self.relation_rows.get(relation_id, [])
+        else:
+            rows = range(len(graph.out_targets))
+
+        matches = []
+        for row in rows:
+            if object_id is not None and graph.out_targets[row] != object_id:
+                continue
+            if relation_id is not None and graph.out_relations[row] != relation_id:
+                continue
+            if subject_type is not None and graph.entity_types[self.edge_sources[row]] != subject_type:
+                continue
+            if object_type is not None and graph.entity_types[graph.out_targets[row]] != object_type:
+                continue
+            matches.append(self.edge(row))
+        return matches
+
+    def neighborhood(self, name, hops=1, direction="both"):
+        """
+        Entities within `hops` edges of an entity, following outgoing ("out"),
+        incoming ("in") or both edge directions. Returns ({entity: distance}, triples).
+        """
+        graph = self.graph
+        start = self.entity_id(name)
+        if start is None:
+            return {}, []
+        distances = {start: 0}
+        frontier = [start]
+        rows = set()
+        for distance in range(1, hops + 1):
+            next_frontier = []
+            for e in frontier:
+                neighbors = []
+                if direction in ("out", "both"):
+                    for row in range(graph.out_offsets[e], graph.out_offsets[e + 1]):
+                        rows.add(row)
+                        neighbors.append(graph.out_targets[row])
+                if direction in ("in", "both"):
+                    for in_row in range(graph.in_offsets[e], graph.in_offsets[e + 1]):
+                        rows.add(graph.in_edges[in_row])
+                        neighbors.append(graph.in_sources[in_row])
+                for neighbor in neighbors:
+                    if neighbor not in distances:
+                        distances[neighbor] = distance
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        entities = {graph.entities[e]: distance for e, distance in distances.items()}
+        return entities, [self.edge(row) for row in sorted(rows)]
+
+
+def print_triples(triples):
+    for triple in triples:
+        print(f"({triple['subject']}) -[{triple['relation']}]-> ({triple['object']})  # {triple['sentence']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the knowledge graph")
+    parser.add_argument("--graph", default="projects/prls/knowledge_graph.json", help="knowledge_graph.json or a .kgb file")
+    parser.add_argument("--aliases", help="alias index from entity_resolution.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    entity_parser = commands.add_parser("entity", help="type and sentences of an entity")
+    entity_parser.add_argument("name")
+
+    type_parser = commands.add_parser("type", help="entities of a type")
+    type_parser.add_argument("entity_type")
+
+    triples_parser = commands.add_parser("triples", help="triples matching a pattern")
+    triples_parser.add_argument("--subject")
+    triples_parser.add_argument("--relation")
+    triples_parser.add_argument("--object")
+    triples_parser.add_argument("--subject-type")
+    triples_parser.add_argument("--object-type")
+
+    neighbors_parser = commands.add_parser("neighbors", help="entities within k hops of an entity")
+    neighbors_parser.add_argument("name")
+    neighbors_parser.add_argument("--hops", type=int, default=1)
+    neighbors_parser.add_argument("--direction", choices=["out", "in", "both"], default="both")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    query = GraphQuery.load(args.graph, load_aliases(args.aliases) if args.aliases else None)
+    logging.info(f"Loaded {len(query.graph.entities)} entities from {args.graph} in {time.perf_counter() - started:.3f}s")
+
+    started = time.perf_counter()
+    if args.command == "entity":
+        result = query.entity(args.name)
+        if result is None:
+            print(f"No entity named {args.name}")
+        else:
+            print(f"{result['entity']} ({result['type']}), in {len(result['sentences'])} sentences:")
+            for file_name, index, text in result["sentences"]:
+                print(f"  {file_name}#{index}: {text}")
+    elif args.command == "type":
+        for name in query.entities_of_type(args.entity_type):
+            print(name)
+    elif args.command == "triples":
+        print_triples(
+            query.triples(args.subject, args.relation, args.object, args.subject_type, args.object_type)
+        )
+    elif args.command == "neighbors":
+        entities, triples = query.neighborhood(args.name, args.hops, args.direction)
+        for name, distance in sorted(entities.items(), key=lambda item: item[1]):
+            print(f"{distance} {name}")
+        print_triples(triples)
+    logging.info(f"Query took {(time.perf_counter() - started) * 1000:.2f} ms")
@@ -1,54 +1,45 @@
+import argparse
 import json
 import logging
 from flair.data import Sentence
-from flair.nn import Classifier
+from model_registry import get_flair
+from flair_batching import MINI_BATCH_SIZE
+from flair_pool import predict_articles
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-# Load the entity linker
-linker = Classifier.load("linker")
+LINKER_MODEL = "linker"
 
 
-def extract_linked_entities_with_flair(article_text):
-    """Extract linked entities using Flair entity linker"""
-    sentence = Sentence(article_text)
-    linker.predict(sentence)
-    linked_entities = [
+def spans_to_linked_entities(sentence):
+    """Read the linked entities off a predicted Flair sentence"""
+    return [
         {"entity": entity.text, "link": entity.get_label("link").value}
         for entity in sentence.get_spans("link")
     ]
-    return linked_entities
 
 
-def process_articles(input_file, output_file):
-    """Process articles and extract linked entities using Flair"""
+def extract_linked_entities_with_flair(article_text):
+    """Extract linked entities using Flair entity linker"""
+    sentence = Sentence(article_text)
+    get_flair(LINKER_MODEL).predict(sentence)
+    return spans_to_linked_entities(sentence)
+
+
+def process_articles(input_file, output_file, mini_batch_size=MINI_BATCH_SIZE, workers=1):
+    """Process articles and extract linked entities using Flair, predicting in mini-batches across articles"""
     with open(input_file, "r", encoding="utf-8") as f:
         articles = json.load(f)
 
-    extracted_linked_entities = {}
-
     total_sentences = sum(len(sentences) for sentences in articles.values())
-    processed_sentences = 0
-
-    for file_name, sentences_list in articles.items():
-        processed_sentences += len(sentences_list)
-        logging.info(f"Extracting linked entities from article: {file_name}")
-        sentence_linked_entities = []
-
-        for i, sentence in enumerate(sentences_list):
-            logging.info(
-                f"Extracting linked entities from sentence {i + 1}/{len(sentences_list)} in article: {file_name}"
-            )
-            linked_entities = extract_linked_entities_with_flair(sentence)
-            sentence_linked_entities.append(linked_entities)
-
-        extracted_linked_entities[file_name] = sentence_linked_entities
-        logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
-        logging.info(f"Extracted linked entities for {len(sentence_linked_entities)} sentences in article: {file_name}")
-        logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
+    logging.info(f"Extracting linked entities from {total_sentences} sentences in {len(articles)} articles")
+    extracted_linked_entities = predict_articles(
+        LINKER_MODEL, articles, spans_to_linked_entities, workers=workers, mini_batch_size=mini_batch_size
+    )
+    logging.info(f"Processed {total_sentences}/{total_sentences} sentences.")
 
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(extracted_linked_entities, f, indent=4, ensure_ascii=False)
@@ -56,7 +47,14 @@ def process_articles(input_file, output_file):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract linked entities with Flair")
+    parser.add_argument("--mini-batch-size", type=int, default=MINI_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, each with its own model")
+    args = parser.parse_args()
+
     input_file = "projects/prls/decontextualized_articles.json"
     output_file = "projects/prls/extracted_linked_entities.json"
 
-    process_articles(input_file, output_file)
+    process_articles(
+        input_file, output_file, mini_batch_size=args.mini_batch_size, workers=args.workers
+    )
@@ -0,0 +1,259 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from openai import AsyncOpenAI
+from llm_cache import get_cache, load_response, record_usage, request_key, stats
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+BATCH_DIR = os.environ.get("KGB_BATCH_DIR", ".llm_batches")
+POLL_INTERVAL = float(os.environ.get("KGB_BATCH_POLL_INTERVAL", "30"))
+# The Batch API accepts at most 50,000 requests per input file
+MAX_BATCH_REQUESTS = 50000
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def strict_schema(schema):
+    """
+    Make a Pydantic JSON schema strict, as Structured Outputs require: every
+    object lists all its properties as required and allows no others.
+    """
+    if isinstance(schema, dict):
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["additionalProperties"] = False
+            schema["required"] = list(schema["properties"])
+        for value in schema.values():
+            strict_schema(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            strict_schema(value)
+    return schema
+
+
+def response_format_param(response_format):
+    """The json_schema response_format that client.beta.chat.completions.parse sends for a Pydantic model."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": response_format.__name__,
+            "schema": strict_schema(response_format.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+
+class BatchRequestError(Exception):
+    """A request that did not produce a usable response in any batch attempt."""
+
+
+class BatchExecutor:
+    """
+    Drop-in replacement for LLMExecutor that runs requests through the OpenAI Batch API.
+    Stage coroutines call parse() exactly as with LLMExecutor. Whenever every
+    coroutine is waiting on a response, the pending requests are written to a
+    JSONL file, submitted as a batch and polled until done; the results are
+    cached and handed back to the waiting coroutines. Requests that fail are
+    resubmitted up to max_attempts times before raising BatchRequestError.
+    """
+
+    def __init__(
+        self,
+        batch_dir=BATCH_DIR,
+        poll_interval=POLL_INTERVAL,
+        completion_window="24h",
+        max_attempts=2,
+        base_url=None,
+    ):
+        self.batch_dir = Path(batch_dir)
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_attempts = max_attempts
+        self.base_url = base_url
+        self.client = None
+        self.pending = {}
+        self.batch_count = 0
+
+    def start(self):
+        """Create the client; OPENAI_BASE_URL or base_url may point at a stand-in server."""
+        self.client = AsyncOpenAI(base_url=self.base_url) if self.base_url else AsyncOpenAI()
+        self.batch_dir.mkdir(parents=True, exist_ok=True)
+
+    async def parse(self, stage, model, messages, response_format=None):
+        """Queue a request for the next batch and wait for its response."""
+        cache = get_cache()
+        key = request_key(model, messages, response_format)
+        content = cache.get(key)
+        if content is not None:
+            stats[stage]["hits"] += 1
+            return load_response(content, response_format)
+
+        if key in self.pending:
+            stats[stage]["hits"] += 1
+            future = self.pending[key]["future"]
+        else:
+            stats[stage]["misses"] += 1
+            future = asyncio.get_running_loop().create_future()
+            self.pending[key] = {
+                "future": future,
+                "stage": stage,
+                "model": model,
+                "messages": messages,
+                "response_format": response_format,
+            }
+        content = await asyncio.shield(future)
+        return load_response(content, response_format) if content is not None else None
+
+    async def run_in_order(self, coroutines):
+        """Run coroutines concurrently and return their results in submission order."""
+        return await asyncio.gather(*coroutines)
+
+    def run(self, coroutine):
+        """Run a coroutine to completion, submitting batches as its requests queue up."""
+        self.start()
+        return asyncio.run(self.drive(coroutine))
+
+    async def drive(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        while not task.done():
+            await self.settle(task)
+            if self.pending:
+                requests, self.pending = self.pending, {}
+                await self.submit(requests)
+            elif not task.done():
+                await asyncio.sleep(0.01)
+        return task.result()
+
+    async def settle(self, task):
+        """Yield to the event loop until no new requests are being queued."""
+        stable_rounds = 0
+        count = len(self.pending)
+        while stable_rounds < 3 and not task.done():
+            await asyncio.sleep(0)
+            stable_rounds = stable_rounds + 1 if len(self.pending) == count else 0
+            count = len(self.pending)
+
+    async def submit(self, requests):
+        """Submit queued requests as batches, retrying failures, and resolve their futures."""
+        remaining = dict(requests)
+        errors = {}
+        for attempt in range(1, self.max_attempts + 1):
+            if not remaining:
+                break
+            logging.info(
+                f"Submitting {len(remaining)} requests to the Batch API (attempt {attempt}/{self.max_attempts})"
+            )
+            keys = list(remaining)
+            results = {}
+            for start in range(0, len(keys), MAX_BATCH_REQUESTS):
+                chunk = {key: remaining[key] for key in keys[start : start + MAX_BATCH_REQUESTS]}
+                chunk_results, chunk_errors = await self.run_batch(chunk)
+                results.update(chunk_results)
+                errors.update(chunk_errors)
+
+            cache = get_cache()
+            for key, content in results.items():
+                request = remaining.pop(key)
+                if content is not None:
+                    cache.put(key, request["stage"], content)
+                errors.pop(key, None)
+                request["future"].set_result(content)
+            if remaining:
+                logging.warning(f"{len(remaining)} batch requests failed on attempt {attempt}")
+
+        for key, request in remaining.items():
+            request["future"].set_exception(
+                BatchRequestError(errors.get(key, "no response in batch output"))
+            )
+
+    def write_input_file(self, requests):
+        """Write requests as Batch API JSONL, using the cache key as custom_id."""
+        self.batch_count += 1
+        path = self.batch_dir / f"batch_{time.strftime('%Y%m%dT%H%M%S')}_{self.batch_count}.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            for key, request in requests.items():
+                body = {"model": request["model"], "messages": request["messages"]}
+                if request["response_format"] is not None:
+                    body["response_format"] = response_format_param(request["response_format"])
+                line = {
+                    "custom_id": key,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body,
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return path
+
+    async def run_batch(self, requests):
+        """Run one batch and return ({key: content}, {key: error message})."""
+        path = self.write_input_file(requests)
+        input_file = await self.client.files.create(file=path, purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+            metadata={"input": path.name},
+        )
+        logging.info(f"Submitted batch {batch.id} from {path}")
+
+        while batch.status not in FINAL_STATUSES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            if counts:
+                logging.info(
+                    f"Batch {batch.id} is {batch.status}: {counts.completed}/{counts.total} completed, {counts.failed} failed"
+                )
+        logging.info(f"Batch {batch.id} finished with status {batch.status}")
+
+        results = {}
+        errors = {}
+        if batch.output_file_id:
+            output = (await self.client.files.content(batch.output_file_id)).text
+            path.with_suffix(".output.jsonl").write_text(output, encoding="utf-8")
+            for key, content, error, usage in parse_output_lines(output):
+                if key not in requests:
+                    continue
+                record_usage(requests[key]["stage"], usage)
+                if error is None:
+                    results[key] = content
+                else:
+                    errors[key] = error
+        if batch.error_file_id:
+            output = (await self.client.files.content(batch.error_file_id)).text
+            path.with_suffix(".errors.jsonl").write_text(output, encoding="utf-8")
+            for key, content, error, usage in parse_output_lines(output):
+                errors[key] = error
+        return results, errors
+
+
+def parse_output_lines(output):
+    """
+    Yield (custom_id, content, error, usage) from batch output JSONL.
+    Refusals and empty answers yield no content and no error, like the
+    interactive path, so they are not retried.
+    """
+    for line in io.StringIO(output):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        key = record.get("custom_id")
+        error = record.get("error")
+        response = record.get("response") or {}
+        if error or response.get("status_code") != 200:
+            message = (error or {}).get("message") or f"status {response.get('status_code')}"
+            yield key, None, message, None
+            continue
+        body = response.get("body", {})
+        choices = body.get("choices") or []
+        message = choices[0].get("message", {}) if choices else {}
+        if not message.get("content") or message.get("refusal"):
+            yield key, None, None, body.get("usage")
+            continue
+        yield key, message["content"], None, body.get("usage")
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from openai import OpenAI
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+CACHE_PATH = os.environ.get("KGB_LLM_CACHE", ".llm_cache.sqlite")
+MAX_AGE_DAYS = float(os.environ.get("KGB_LLM_CACHE_MAX_AGE_DAYS", "30"))
+MAX_MB = float(os.environ.get("KGB_LLM_CACHE_MAX_MB", "512"))
+
+# Per-stage hit/miss counters and API input tokens, reported by log_cache_stats()
+stats = defaultdict(
+    lambda: {"hits": 0, "misses": 0, "input_tokens": 0, "cached_input_tokens": 0}
+)
+
+
+class LLMCache:
+    """On-disk SQLite cache of LLM responses keyed by a hash of the request."""
+
+    def __init__(self, path=CACHE_PATH, max_age_days=MAX_AGE_DAYS, max_mb=MAX_MB):
+        self.path = path
+        self.max_age = max_age_days * 24 * 3600
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                stage TEXT,
+                content TEXT,
+                size INTEGER,
+                created REAL,
+                accessed REAL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self.puts_since_evict = 0
+        self.evict()
+
+    def get(self, key):
+        """Return the cached response content for key, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            content, created = row
+            now = time.time()
+            if now - created > self.max_age:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self.conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            return content
+
+    def put(self, key, stage, content):
+        """Store response content for key and evict periodically."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage, content, len(content.encode("utf-8")), now, now),
+            )
+            self.puts_since_evict += 1
+        if self.puts_since_evict >= 100:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones above the size limit."""
+        with self.lock:
+            self.puts_since_evict = 0
+            self.conn.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+            )
+            total = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self.conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed"
+            ).fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+            logging.info(f"Evicted {len(stale)} entries from LLM cache {self.path}")
+
+
+_client = None
+_cache = None
+_cache_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide OpenAI client, creating it on first use so importing needs no API key."""
+    global _client
+    with _cache_lock:
+        if _client is None:
+            _client = OpenAI()
+        return _client
+
+
+def get_cache():
+    """Return the process-wide LLM cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def request_key(model, messages, response_format=None):
+    """Hash the model, messages and response schema into a cache key."""
+    schema = response_format.model_json_schema() if response_format else None
+    payload = json.dumps(
+        {"model": model, "messages": messages, "schema": schema},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_response(content, response_format=None):
+    """Turn cached response content back into the parsed response."""
+    if response_format is None:
+        return content
+    return response_format.model_validate_json(content)
+
+
+def record_usage(stage, usage):
+    """Add the input tokens of an API response, and how many the provider served from its prompt cache."""
+    if not usage:
+        return
+    if isinstance(usage, dict):
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        details = usage.get("prompt_tokens_details") or {}
+        cached_tokens = details.get("cached_tokens") or 0
+    else:
+        prompt_tokens = usage.prompt_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (details.cached_tokens or 0) if details else 0
+    stats[stage]["input_tokens"] += prompt_tokens
+    stats[stage]["cached_input_tokens"] += cached_tokens
+
+
+def complete(stage, model, messages, response_format=None):
+    """Call the API and return the raw message content, or None."""
+    client = get_client()
+    if response_format is None:
+        completion = client.chat.completions.create(model=model, messages=messages)
+    else:
+        completion = client.beta.chat.completions.parse(
+            model=model, messages=messages, response_format=response_format
+        )
+    if not completion or not completion.choices:
+        return None
+    record_usage(stage, completion.usage)
+    message = completion.choices[0].message
+    if response_format is not None and message.parsed is None:
+        return None
+    return message.content
+
+
+def cached_parse(stage, model, messages, response_format=None):
+    """
+    Run a chat completion through the shared response cache.
+    Returns the parsed response_format instance (or the message text when
+    no response_format is given), or None if the API returned nothing usable.
+    Identical requests issued concurrently share a single API call.
+    """
+    cache = get_cache()
+    key = request_key(model, messages, response_format)
+    content = cache.get(key)
+    if content is not None:
+        stats[stage]["hits"] += 1
+        return load_response(content, response_format)
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+
+    if not owner:
+        stats[stage]["hits"] += 1
+        content = future.result()
+        return load_response(content, response_format) if content is not None else None
+
+    stats[stage]["misses"] += 1
+    try:
+        content = complete(stage, model, messages, response_format)
+        if content is not None:
+            cache.put(key, stage, content)
+        future.set_result(content)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return load_response(content, response_format) if content is not None else None
+
+
+def log_cache_stats():
+    """Log LLM cache hit/miss counters and prompt-cached input tokens for every stage seen so far."""
+    for stage, counts in sorted(stats.items()):
+        total = counts["hits"] + counts["misses"]
+        rate = counts["hits"] / total if total else 0.0
+        logging.info(
+            f"LLM cache [{stage}]: {counts['hits']} hits, {counts['misses']} misses ({rate:.0%} hit rate)"
+        )
+        if counts["input_tokens"]:
+            uncached = counts["input_tokens"] - counts["cached_input_tokens"]
+            logging.info(
+                f"Input tokens [{stage}]: {counts['cached_input_tokens']} cached by the provider, {uncached} uncached"
+            )
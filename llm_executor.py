@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import time
+from openai import AsyncOpenAI
+from llm_cache import get_cache, load_response, record_usage, request_key, stats
+from prompt_builder import count_message_tokens
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+CONCURRENCY = int(os.environ.get("KGB_LLM_CONCURRENCY", "16"))
+REQUESTS_PER_MINUTE = int(os.environ.get("KGB_LLM_RPM", "500"))
+TOKENS_PER_MINUTE = int(os.environ.get("KGB_LLM_TPM", "200000"))
+
+
+class RateLimiter:
+    """Token bucket that refills a per-minute budget continuously."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        """Wait until amount units of budget are available and consume them."""
+        # Requests larger than the whole budget wait for a full bucket
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(
+                    self.capacity, self.available + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+
+class LLMExecutor:
+    """
+    Concurrent AsyncOpenAI executor shared by the LLM stages.
+    Requests go through the response cache, at most `concurrency` run at a
+    time, and the requests-per-minute and tokens-per-minute budgets are
+    respected. Results of run_in_order() keep the order of the submitted work.
+    """
+
+    def __init__(
+        self,
+        concurrency=CONCURRENCY,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+    ):
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.client = None
+
+    def start(self):
+        """Create the client and limiters inside the running event loop."""
+        self.client = AsyncOpenAI()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.request_limiter = RateLimiter(self.requests_per_minute)
+        self.token_limiter = RateLimiter(self.tokens_per_minute)
+        self.inflight = {}
+
+    async def complete(self, stage, model, messages, response_format=None):
+        """Call the API and return the raw message content, or None."""
+        async with self.semaphore:
+            await self.request_limiter.acquire(1)
+            await self.token_limiter.acquire(count_message_tokens(messages, model))
+            if response_format is None:
+                completion = await self.client.chat.completions.create(
+                    model=model, messages=messages
+                )
+            else:
+                completion = await self.client.beta.chat.completions.parse(
+                    model=model, messages=messages, response_format=response_format
+                )
+        if not completion or not completion.choices:
+            return None
+        record_usage(stage, completion.usage)
+        message = completion.choices[0].message
+        if response_format is not None and message.parsed is None:
+            return None
+        return message.content
+
+    async def parse(self, stage, model, messages, response_format=None):
+        """Async counterpart of llm_cache.cached_parse."""
+        if self.client is None:
+            self.start()
+        cache = get_cache()
+        key = request_key(model, messages, response_format)
+        content = cache.get(key)
+        if content is not None:
+            stats[stage]["hits"] += 1
+            return load_response(content, response_format)
+
+        future = self.inflight.get(key)
+        if future is not None:
+            stats[stage]["hits"] += 1
+            content = await asyncio.shield(future)
+            return load_response(content, response_format) if content is not None else None
+
+        stats[stage]["misses"] += 1
+        future = self.inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            content = await self.complete(stage, model, messages, response_format)
+            if content is not None:
+                cache.put(key, stage, content)
+            future.set_result(content)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+        return load_response(content, response_format) if content is not None else None
+
+    async def run_in_order(self, coroutines):
+        """Run coroutines concurrently and return their results in submission order."""
+        return await asyncio.gather(*coroutines)
+
+    def run(self, coroutine):
+        """Run a coroutine to completion from synchronous code."""
+        self.client = None
+        return asyncio.run(coroutine)
+
+
+async def parse_or_none(executor, request, action):
+    """
+    Send one request through an executor; None when it raised (a 429 or a
+    BatchRequestError, say) or gave no usable answer, so that one failed
+    request fails its own sentence instead of the whole run.
+    """
+    try:
+        response = await executor.parse(**request)
+    except Exception as e:
+        logging.error(f"Error {action}: {str(e)}")
+        return None
+    if response is None:
+        logging.warning(f"No valid response received from OpenAI API while {action}")
+    return response
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# "torch" runs Flair models as loaded; "onnx" exports transformer embeddings to
+# int8-quantized ONNX Runtime models and dynamically quantizes the rest
+FLAIR_BACKEND = os.environ.get("KGB_FLAIR_BACKEND", "torch")
+ONNX_DIR = os.environ.get("KGB_ONNX_DIR", ".onnx_models")
+
+# Process-wide cache of loaded models, keyed by (kind, name)
+models = {}
+# Seconds each model took to load
+load_times = {}
+
+_lock = threading.Lock()
+_model_locks = {}
+
+
+def load_spacy(name):
+    import spacy
+
+    return spacy.load(name)
+
+
+def load_spacy_sentencizer(lang):
+    """A blank pipeline with only the rule-based sentencizer, for sentence boundaries alone."""
+    import spacy
+
+    nlp = spacy.blank(lang)
+    nlp.add_pipe("sentencizer")
+    return nlp
+
+
+def load_flair_classifier(name):
+    from flair.nn import Classifier
+
+    return Classifier.load(name)
+
+
+def load_flair_tagger(name):
+    from flair.models import SequenceTagger
+
+    return SequenceTagger.load(name)
+
+
+def quantize_for_cpu(model, name):
+    """
+    Make a Flair tagger cheaper on CPU. Transformer embeddings are exported
+    to ONNX, int8-quantized and run by ONNX Runtime; models without them
+    (e.g. the Flair-embedding LSTM of flair/chunk-english) get PyTorch
+    dynamic int8 quantization of their LSTM and Linear layers.
+    """
+    import torch
+    from flair.data import Sentence
+    from flair.embeddings import TransformerEmbeddings
+
+    if isinstance(model.embeddings, TransformerEmbeddings):
+        onnx_dir = Path(ONNX_DIR)
+        onnx_dir.mkdir(parents=True, exist_ok=True)
+        stem = name.replace("/", "_")
+        example = [Sentence("Elon Musk sued OpenAI in San Francisco on Monday.")]
+        model.embeddings = model.embeddings.export_onnx(
+            onnx_dir / f"{stem}.onnx", example, providers=["CPUExecutionProvider"]
+        )
+        model.embeddings.quantize_model(
+            onnx_dir / f"{stem}.quantized.onnx", extra_options={"DisableShapeInference": True}
+        )
+        return model
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.LSTM, torch.nn.GRU, torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def load_flair_classifier_onnx(name):
+    return quantize_for_cpu(load_flair_classifier(name), name)
+
+
+def load_flair_tagger_onnx(name):
+    return quantize_for_cpu(load_flair_tagger(name), name)
+
+
+# spaCy and Flair are imported by the loaders, so importing a stage module stays cheap
+LOADERS = {
+    "spacy": load_spacy,
+    "spacy_sentencizer": load_spacy_sentencizer,
+    "flair": load_flair_classifier,
+    "flair_tagger": load_flair_tagger,
+    "flair_onnx": load_flair_classifier_onnx,
+    "flair_tagger_onnx": load_flair_tagger_onnx,
+}
+
+
+def get_model(kind, name):
+    """Return the model, loading it on first use; concurrent callers share one load."""
+    key = (kind, name)
+    if key in models:
+        return models[key]
+    with _lock:
+        model_lock = _model_locks.setdefault(key, threading.Lock())
+    with model_lock:
+        if key not in models:
+            logging.info(f"Loading {kind} model {name}")
+            started = time.perf_counter()
+            models[key] = LOADERS[kind](name)
+            load_times[key] = time.perf_counter() - started
+            logging.info(f"Loaded {kind} model {name} in {load_times[key]:.1f}s")
+    return models[key]
+
+
+def get_spacy(name="en_core_web_sm"):
+    return get_model("spacy", name)
+
+
+def get_spacy_sentencizer(lang="en"):
+    return get_model("spacy_sentencizer", lang)
+
+
+def get_flair(name, backend=None):
+    backend = backend or FLAIR_BACKEND
+    return get_model("flair_onnx" if backend == "onnx" else "flair", name)
+
+
+def get_flair_tagger(name, backend=None):
+    backend = backend or FLAIR_BACKEND
+    return get_model("flair_tagger_onnx" if backend == "onnx" else "flair_tagger", name)
+
+
+def preload(*specs):
+    """
+    Load (kind, name) models in a background thread so they are ready by the
+    time they are first needed. Returns the thread.
+    """
+
+    def load_all():
+        for kind, name in specs:
+            try:
+                get_model(kind, name)
+            except Exception as e:
+                logging.error(f"Error preloading {kind} model {name}: {str(e)}")
+
+    thread = threading.Thread(target=load_all, name="model-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def log_load_times():
+    """Log how long every model loaded so far took to load."""
+    for (kind, name), seconds in sorted(load_times.items()):
+        logging.info(f"Model {kind}/{name} loaded in {seconds:.1f}s")
@@ -0,0 +1,78 @@
+import argparse
+import json
+import logging
+import time
+from chunking_flair import chunk_sentences_with_flair
+from extract_entities_flair import extract_entities_with_flair
+from flair_batching import flatten_articles
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def agreement(reference, candidate):
+    """Precision, recall and F1 of candidate items against reference items, summed over sentences."""
+    matched = 0
+    reference_total = 0
+    candidate_total = 0
+    exact = 0
+    for expected, predicted in zip(reference, candidate):
+        expected_items = set(expected)
+        predicted_items = set(predicted)
+        matched += len(expected_items & predicted_items)
+        reference_total += len(expected_items)
+        candidate_total += len(predicted_items)
+        exact += expected_items == predicted_items
+    precision = matched / candidate_total if candidate_total else 1.0
+    recall = matched / reference_total if reference_total else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "exact_match": exact / len(reference) if reference else 1.0,
+    }
+
+
+def run_backend(function, texts, backend, to_items):
+    """Run a Flair function over texts with one backend; returns (items per text, seconds)."""
+    # Load the model outside the timed loop
+    function(texts[0], backend=backend)
+    started = time.perf_counter()
+    results = [to_items(function(text, backend=backend)) for text in texts]
+    return results, time.perf_counter() - started
+
+
+def check_parity(name, function, texts, to_items):
+    torch_results, torch_seconds = run_backend(function, texts, "torch", to_items)
+    onnx_results, onnx_seconds = run_backend(function, texts, "onnx", to_items)
+    scores = agreement(torch_results, onnx_results)
+    logging.info(
+        f"{name}: F1 {scores['f1']:.3f} (P {scores['precision']:.3f}, R {scores['recall']:.3f}), "
+        f"{scores['exact_match']:.1%} of sentences identical; "
+        f"{torch_seconds:.1f}s with torch, {onnx_seconds:.1f}s with onnx "
+        f"({torch_seconds / onnx_seconds if onnx_seconds else 0:.1f}x)"
+    )
+    return scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the ONNX/quantized Flair backend with PyTorch")
+    parser.add_argument("--input", default="projects/prls/decontextualized_articles.json")
+    parser.add_argument("--limit", type=int, default=200, help="number of sentences to compare")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+    texts = flatten_articles(articles)[1][: args.limit]
+    logging.info(f"Comparing backends on {len(texts)} sentences from {args.input}")
+
+    check_parity(
+        "NER",
+        extract_entities_with_flair,
+        texts,
+        lambda entities: [(entity["entity"], entity["type"]) for entity in entities],
+    )
+    check_parity("Chunking", chunk_sentences_with_flair, texts, lambda chunks: chunks)
@@ -1,22 +1,20 @@
+import argparse
 import json
 import logging
-from openai import OpenAI
 from pydantic import BaseModel
 from pathlib import Path
+from llm_cache import log_cache_stats
+from llm_batch import BatchExecutor
+from llm_executor import LLMExecutor
+from prompt_builder import PromptTemplate
+from stage_journal import StageJournal, journaled, request_fingerprint
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-client = OpenAI()
 
 
-class ParaphrasedArticle(BaseModel):
-    file_name: str
-    paraphrased_text: str
-
-
-def paraphrase_article(article_text, entities):
-    """Paraphrase article using OpenAI API"""
-    few_shot_prompt = """
+# Static few-shot prefix shared by every paraphrasing request
+FEW_SHOT_PROMPT = """
     Paraphrase the given text using the given entities.
 
     Given the text: {text}
@@ -45,24 +43,31 @@ def paraphrase_article(article_text, entities):
     Original Text: "The sun was shining brightly in the sky." Entities: ["sun:Celestial Body", "sky:Loc"] Paraphrased Text: "The celestial body radiated luminosity within the expanse of the location." Explanation: The paraphrased text is excessively formal and uses unnecessarily scientific terminology.
     """
 
+PARAPHRASE_TEMPLATE = PromptTemplate(
+    "paraphrase_article",
+    system="You are a helpful assistant that paraphrases text using given entities.",
+    prefix=FEW_SHOT_PROMPT,
+)
+
+
+class ParaphrasedArticle(BaseModel):
+    file_name: str
+    paraphrased_text: str
+
+
+def paraphrase_request(article_text, entities):
+    """Build the paraphrasing request for one sentence"""
+    return PARAPHRASE_TEMPLATE.request(
+        f"\n\nOriginal Text: {article_text}\nEntities: {entities}", ParaphrasedArticle
+    )
+
+
+async def paraphrase_article_async(executor, article_text, entities):
+    """Paraphrase article through the concurrent LLM executor"""
     try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that paraphrases text using given entities.",
-                },
-                {
-                    "role": "user",
-                    "content": f"{few_shot_prompt}\n\nOriginal Text: {article_text}\nEntities: {entities}",
-                },
-            ],
-            response_format=ParaphrasedArticle,
-        )
+        paraphrased = await executor.parse(**paraphrase_request(article_text, entities))
 
-        if completion and completion.choices:
-            paraphrased = completion.choices[0].message.parsed
+        if paraphrased:
             return paraphrased
 
         logging.warning("No valid response received from OpenAI API")
@@ -73,7 +78,59 @@ def paraphrase_article(article_text, entities):
         return None
 
 
-def process_articles(output_file):
+async def paraphrase_sentence(executor, file_name, i, sentences_list, entities_list):
+    """Paraphrase the i-th sentence of an article"""
+    logging.info(f"Paraphrasing sentence {i+1}/{len(sentences_list)} in article: {file_name}")
+    entities = entities_list[i] if i < len(entities_list) else []
+    paraphrased = await paraphrase_article_async(executor, sentences_list[i], entities)
+    return paraphrased.paraphrased_text if paraphrased else None
+
+
+async def paraphrase_sentences(executor, file_name, sentences_list, entities_list, journal=None):
+    """Paraphrase all sentences of an article concurrently, keeping their order"""
+    logging.info(f"Paraphrasing article: {file_name}")
+    if len(sentences_list) != len(entities_list):
+        logging.warning(f"Mismatch in number of sentences and entities for article: {file_name}")
+
+    paraphrased = await executor.run_in_order(
+        journaled(
+            journal,
+            request_fingerprint(
+                paraphrase_request(
+                    sentences_list[i], entities_list[i] if i < len(entities_list) else []
+                )
+            ),
+            paraphrase_sentence(executor, file_name, i, sentences_list, entities_list),
+        )
+        for i in range(len(sentences_list))
+    )
+    # A failed paraphrase falls back to the sentence itself, so later stages can pair lists by index
+    paraphrased_sentences = [
+        p if p is not None else sentence for p, sentence in zip(paraphrased, sentences_list)
+    ]
+    failed = sum(p is None for p in paraphrased)
+    logging.info(
+        f"Paraphrased {len(paraphrased_sentences) - failed} sentences in article: {file_name}"
+        + (f" ({failed} kept unparaphrased)" if failed else "")
+    )
+    return paraphrased_sentences
+
+
+async def paraphrase_articles(executor, decontextualized_articles, extracted_entities, journal=None):
+    """Paraphrase every article concurrently"""
+    results = await executor.run_in_order(
+        paraphrase_sentences(
+            executor, file_name, sentences_list, extracted_entities.get(file_name, []), journal
+        )
+        for file_name, sentences_list in decontextualized_articles.items()
+    )
+    return {
+        file_name: {"paraphrased_sentences": paraphrased_sentences}
+        for file_name, paraphrased_sentences in zip(decontextualized_articles, results)
+    }
+
+
+def process_articles(output_file, batch=False):
     """Process articles and paraphrase them"""
     logging.info("Loading decontextualized articles from projects/prls/decontextualized_articles.json")
     with open("projects/prls/decontextualized_articles.json", "r", encoding="utf-8") as f:
@@ -83,42 +140,26 @@ def process_articles(output_file):
     with open("projects/prls/extracted_entities.json", "r", encoding="utf-8") as f:
         extracted_entities = json.load(f)
 
-    paraphrased_articles = {}
-
     total_sentences = sum(len(sentences) for sentences in decontextualized_articles.values())
-    processed_sentences = 0
-
-    for file_name, sentences_list in list(decontextualized_articles.items())[:]:
-        processed_sentences += len(sentences_list)
-        sentences_list = sentences_list[:]
-        logging.info(f"Paraphrasing article: {file_name}")
-        entities_list = extracted_entities.get(file_name, [])
-        if len(sentences_list) != len(entities_list):
-            logging.warning(f"Mismatch in number of sentences and entities for article: {file_name}")
-
-        paraphrased_sentences = []
-        entities_list = extracted_entities.get(file_name, [])
-
-        for i, sentence in enumerate(sentences_list):
-            logging.info(f"Paraphrasing sentence {i+1}/{len(sentences_list)} in article: {file_name}")
-            entities = entities_list[i] if i < len(entities_list) else []
-            paraphrased = paraphrase_article(sentence, entities)
-            if paraphrased:
-                paraphrased_sentences.append(paraphrased.paraphrased_text)
-
-        logging.info(f"Paraphrased {len(paraphrased_sentences)} sentences in article: {file_name}")
-        logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
-        paraphrased_articles[file_name] = {
-            "paraphrased_sentences": paraphrased_sentences
-        }
-
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(paraphrased_articles, f, indent=4, ensure_ascii=False)
+    processed_sentences = total_sentences
+
+    executor = BatchExecutor() if batch else LLMExecutor()
+    with StageJournal(output_file) as journal:
+        paraphrased_articles = executor.run(
+            paraphrase_articles(executor, decontextualized_articles, extracted_entities, journal)
+        )
+
+    journal.compact(paraphrased_articles)
     logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
     logging.info(f"Successfully paraphrased articles into {output_file}")
+    log_cache_stats()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paraphrase decontextualized sentences")
+    parser.add_argument("--batch", action="store_true", help="run through the OpenAI Batch API")
+    args = parser.parse_args()
+
     output_file = "projects/prls/paraphrased_articles.json"
 
-    process_articles(output_file)
+    process_articles(output_file, batch=args.batch)
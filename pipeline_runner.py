@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from chunkers import CHUNK_MODEL, CHUNKERS, get_chunker
+from create_knowledge_nodes import create_node
+from decontextualization import decontextualize_sentence_text
+from entity_pair_pruning import candidate_pairs
+from extract_atomic_facts import extract_atomic_facts_async
+from extract_entities import extract_entities_from_article_async
+from llm_cache import log_cache_stats
+from llm_executor import LLMExecutor
+from model_registry import log_load_times, preload
+from paraphrasing import paraphrase_article_async
+from proposition_extraction import extract_sentence_propositions, successful
+from relation_extraction import (
+    extract_and_validate_relationships_async,
+    extract_and_validate_relationships_joint_async,
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Items waiting between two stages; a full queue blocks the stage upstream
+QUEUE_SIZE = 64
+WORKERS_PER_STAGE = 16
+DECONTEXTUALIZATION_LANES = 32
+
+# Marks the end of a stage's input
+DONE = None
+
+
+class PipelineStage:
+    """
+    One step of the streaming pipeline.
+    `transform` is an async generator taking one item and yielding the items
+    for the next stage; `workers` copies run concurrently over a bounded inbox.
+    """
+
+    def __init__(self, name, transform, workers=WORKERS_PER_STAGE, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.transform = transform
+        self.workers = workers
+        self.queue_size = queue_size
+        self.processed = 0
+
+    async def work(self, outbox):
+        while True:
+            item = await self.inbox.get()
+            if item is DONE:
+                return
+            async for result in self.transform(item):
+                await outbox.put(result)
+            self.processed += 1
+
+    async def run(self, outbox, downstream_workers):
+        """Run all workers, then tell every downstream worker that the input is done."""
+        await asyncio.gather(*(self.work(outbox) for _ in range(self.workers)))
+        logging.info(f"Stage {self.name} finished after {self.processed} items")
+        for _ in range(downstream_workers):
+            await outbox.put(DONE)
+
+
+class PipelineRunner:
+    """
+    Streams articles through chunking -> decontextualization -> entities ->
+    paraphrasing -> relations -> propositions -> atomic facts -> knowledge nodes.
+    Each sentence moves to the next stage as soon as its inputs are ready; only
+    decontextualization keeps the sentences of one article in order.
+    """
+
+    def __init__(self, executor, chunk=True, mode="pairwise", prune=False, chunker="rules"):
+        self.executor = executor
+        self.chunker = get_chunker(chunker)
+        self.mode = mode
+        self.prune = prune
+        self.stages = [
+            PipelineStage("decontextualization", self.decontextualize, DECONTEXTUALIZATION_LANES),
+            PipelineStage("entities", self.extract_entities),
+            PipelineStage("paraphrasing", self.paraphrase),
+            PipelineStage("relations", self.extract_relationships),
+            PipelineStage("propositions", self.extract_propositions),
+            PipelineStage("atomic_facts", self.extract_atomic_facts),
+        ]
+        if chunk:
+            # Model-based chunkers are not safe to share between threads
+            self.stages.insert(0, PipelineStage("chunking", self.chunk, workers=1))
+        self.nodes = []
+        self.started = None
+        self.first_node_at = None
+
+    async def chunk(self, article):
+        body_text = article["article"].get("body_text", "")
+        if body_text:
+            sentences = await asyncio.to_thread(
+                lambda: [sentence for sentence, _ in self.chunker.split(body_text)]
+            )
+            yield {"file_name": article["file_name"], "sentences": sentences}
+
+    async def decontextualize(self, article):
+        decontextualized_sentences = []
+        for index, current_sentence in enumerate(article["sentences"]):
+            sentence = await decontextualize_sentence_text(
+                self.executor, decontextualized_sentences, current_sentence
+            )
+            if sentence is None:
+                continue
+            decontextualized_sentences.append(sentence)
+            yield {
+                "file_name": article["file_name"],
+                "index": index,
+                "total": len(article["sentences"]),
+                "sentence": sentence,
+            }
+
+    async def extract_entities(self, item):
+        entities = await extract_entities_from_article_async(self.executor, item["sentence"])
+        item["entities"] = (
+            [{"entity": entity.entity, "type": entity.type} for entity in entities.entities]
+            if entities
+            else []
+        )
+        yield item
+
+    async def paraphrase(self, item):
+        paraphrased = await paraphrase_article_async(
+            self.executor, item["sentence"], item["entities"]
+        )
+        # A failed paraphrase falls back to the sentence itself, as paraphrasing.py does,
+        # and relationships are then validated against the sentence
+        item["paraphrased"] = paraphrased.paraphrased_text if paraphrased else item["sentence"]
+        yield item
+
+    async def extract_relationships(self, item):
+        extract = (
+            extract_and_validate_relationships_joint_async
+            if self.mode == "joint"
+            else extract_and_validate_relationships_async
+        )
+        item["relationships"] = (
+            await extract(
+                self.executor,
+                item["sentence"],
+                item["paraphrased"],
+                item["entities"],
+                item["index"] + 1,
+                item["total"],
+                candidate_pairs(item["entities"], item["sentence"]) if self.prune else None,
+            )
+            or []
+        )
+        yield item
+
+    async def extract_propositions(self, item):
+        item["propositions"] = successful(
+            await extract_sentence_propositions(self.executor, item["sentence"], item["relationships"])
+        )
+        yield item
+
+    async def extract_atomic_facts(self, item):
+        atomic_facts = await extract_atomic_facts_async(
+            self.executor, item["sentence"], item["propositions"]
+        )
+        item["atomic_facts"] = atomic_facts.facts if atomic_facts else []
+        yield item
+
+    async def collect(self, inbox, workers):
+        """Turn finished sentences into knowledge nodes as they arrive."""
+        finished = 0
+        while finished < workers:
+            item = await inbox.get()
+            if item is DONE:
+                finished += 1
+                continue
+            if self.first_node_at is None:
+                self.first_node_at = time.monotonic()
+                logging.info(
+                    f"First knowledge node after {self.first_node_at - self.started:.1f}s"
+                )
+            self.nodes.append(item)
+
+    async def run(self, articles):
+        """Stream articles through every stage and return the finished sentence items."""
+        self.started = time.monotonic()
+        for stage in self.stages:
+            stage.inbox = asyncio.Queue(stage.queue_size)
+        sink = asyncio.Queue(QUEUE_SIZE)
+        outboxes = [stage.inbox for stage in self.stages[1:]] + [sink]
+        downstream_workers = [stage.workers for stage in self.stages[1:]] + [1]
+
+        tasks = [
+            asyncio.ensure_future(stage.run(outbox, workers))
+            for stage, outbox, workers in zip(self.stages, outboxes, downstream_workers)
+        ]
+        collector = asyncio.ensure_future(self.collect(sink, 1))
+
+        source = self.stages[0]
+        for item in articles:
+            await source.inbox.put(item)
+        for _ in range(source.workers):
+            await source.inbox.put(DONE)
+
+        await asyncio.gather(*tasks, collector)
+        logging.info(
+            f"Created {len(self.nodes)} knowledge nodes in {time.monotonic() - self.started:.1f}s"
+        )
+        return self.nodes
+
+
+def assemble_outputs(file_names, items):
+    """Regroup finished sentence items per article, in sentence order, as the stage scripts write them."""
+    per_article = {file_name: [] for file_name in file_names}
+    for item in items:
+        per_article[item["file_name"]].append(item)
+
+    outputs = {
+        "decontextualized_articles": {},
+        "extracted_entities": {},
+        "paraphrased_articles": {},
+        "extracted_relationships": {},
+        "extracted_propositions": {},
+        "extracted_atomic_facts": {},
+        "knowledge_graph": {},
+    }
+    for file_name, article_items in per_article.items():
+        if not article_items:
+            continue
+        article_items.sort(key=lambda item: item["index"])
+        outputs["decontextualized_articles"][file_name] = [i["sentence"] for i in article_items]
+        outputs["extracted_entities"][file_name] = [i["entities"] for i in article_items]
+        outputs["paraphrased_articles"][file_name] = {
+            "paraphrased_sentences": [i["paraphrased"] for i in article_items]
+        }
+        outputs["extracted_relationships"][file_name] = [i["relationships"] for i in article_items]
+        outputs["extracted_propositions"][file_name] = [i["propositions"] for i in article_items]
+        outputs["extracted_atomic_facts"][file_name] = [i["atomic_facts"] for i in article_items]
+        outputs["knowledge_graph"][file_name] = [
+            create_node(
+                i["sentence"], i["entities"], i["relationships"], i["propositions"], i["atomic_facts"]
+            )
+            for i in article_items
+        ]
+    return outputs
+
+
+def run_pipeline(project_dir, from_chunks=False, mode="pairwise", prune=False, chunker="rules"):
+    """Run every stage of the knowledge graph build for a project as one streaming pipeline"""
+    project_dir = Path(project_dir)
+    if from_chunks:
+        input_file = project_dir / "chunked_articles_flair.json"
+        with open(input_file, "r", encoding="utf-8") as f:
+            chunked_articles = json.load(f)
+        file_names = list(chunked_articles)
+        articles = [
+            {"file_name": file_name, "sentences": sentences}
+            for file_name, sentences in chunked_articles.items()
+        ]
+    else:
+        input_file = project_dir / "merged_articles.json"
+        with open(input_file, "r", encoding="utf-8") as f:
+            merged_articles = json.load(f)
+        file_names = list(merged_articles)
+        articles = [
+            {"file_name": file_name, "article": article}
+            for file_name, article in merged_articles.items()
+        ]
+    logging.info(f"Streaming {len(articles)} articles from {input_file}")
+
+    if not from_chunks and chunker == "flair":
+        # Load the chunker while the input is queued up
+        preload(("flair_tagger", CHUNK_MODEL))
+
+    executor = LLMExecutor()
+    runner = PipelineRunner(executor, chunk=not from_chunks, mode=mode, prune=prune, chunker=chunker)
+    items = executor.run(runner.run(articles))
+
+    for name, data in assemble_outputs(file_names, items).items():
+        output_file = project_dir / f"{name}.json"
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        logging.info(f"Saved {output_file}")
+    log_cache_stats()
+    log_load_times()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build knowledge nodes with all stages streaming into each other")
+    parser.add_argument("--project", default="projects/prls", help="project directory")
+    parser.add_argument(
+        "--from-chunks",
+        action="store_true",
+        help="start from chunked_articles_flair.json instead of chunking merged_articles.json",
+    )
+    parser.add_argument(
+        "--chunker", choices=sorted(CHUNKERS), default="rules", help="sentence chunker for merged_articles.json"
+    )
+    parser.add_argument("--mode", choices=["pairwise", "joint"], default="pairwise")
+    parser.add_argument("--prune", action="store_true", help="prune entity pairs before relation extraction")
+    args = parser.parse_args()
+
+    run_pipeline(
+        args.project, from_chunks=args.from_chunks, mode=args.mode, prune=args.prune, chunker=args.chunker
+    )
@@ -0,0 +1,89 @@
+import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Provider prompt caching only applies to prefixes of at least this many tokens
+MIN_CACHED_PREFIX_TOKENS = 1024
+
+_encodings = {}
+
+
+def get_encoding(model):
+    """Return the tiktoken encoding for a model, or None without tiktoken."""
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    """Count tokens locally; falls back to ~4 characters per token without tiktoken."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model="gpt-4o-mini"):
+    """Count the prompt tokens of chat messages, including per-message overhead."""
+    return sum(count_tokens(message["content"], model) + 4 for message in messages) + 3
+
+
+def fit_to_budget(items, budget, model="gpt-4o-mini"):
+    """Return the longest tail of items whose total token count fits the budget."""
+    selected = []
+    used = 0
+    for item in reversed(items):
+        tokens = count_tokens(item, model) + 1
+        if used + tokens > budget:
+            break
+        selected.append(item)
+        used += tokens
+    return selected[::-1]
+
+
+class PromptTemplate:
+    """
+    A chat prompt split into a static prefix and a per-call suffix.
+    The system message and prefix are kept byte-for-byte identical across
+    calls and always come first, so the provider's prompt cache can reuse
+    them; only the suffix varies.
+    """
+
+    def __init__(self, stage, system, prefix, model="gpt-4o-mini"):
+        self.stage = stage
+        self.system = system
+        self.prefix = prefix
+        self.model = model
+        self.prefix_tokens = count_tokens(system, model) + count_tokens(prefix, model)
+        if self.prefix_tokens < MIN_CACHED_PREFIX_TOKENS:
+            logging.info(
+                f"Static prompt prefix of {stage} is {self.prefix_tokens} tokens; provider caching needs {MIN_CACHED_PREFIX_TOKENS}"
+            )
+
+    def messages(self, suffix):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.prefix + suffix},
+        ]
+
+    def request(self, suffix, response_format=None):
+        """Build a request for llm_cache.cached_parse / LLMExecutor.parse."""
+        return {
+            "stage": self.stage,
+            "model": self.model,
+            "messages": self.messages(suffix),
+            "response_format": response_format,
+        }
@@ -1,21 +1,24 @@
+import argparse
 import json
 import logging
-from openai import OpenAI
 from pydantic import BaseModel
+from llm_cache import log_cache_stats
+from llm_batch import BatchExecutor
+from llm_executor import LLMExecutor
+from stage_journal import StageJournal, fingerprint, journaled, request_fingerprint
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
-client = OpenAI()
 
 
 class Proposition(BaseModel):
     proposition: str
 
 
-def extract_proposition(entity1, relation, entity2, sentence):
-    """Extract a proposition using OpenAI API"""
+def extract_proposition_request(entity1, relation, entity2, sentence):
+    """Build the proposition extraction request for one relationship"""
     # proposition_definition = """
     # A proposition is a natural language sentence or statement that expresses a single, clear, and self-contained idea, fact, or claim about entities and their relationship. It conveys semantic meaning about a specific situation, event, or attribute of entities, enabling it to function independently as a fact in a knowledge graph or as a response to a query.
     # """
@@ -32,25 +35,32 @@ def extract_proposition(entity1, relation, entity2, sentence):
         # f"## Definition of proposition: \n{proposition_definition}"
     )
 
+    return {
+        "stage": "extract_proposition",
+        "model": "gpt-4o",
+        # "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that extracts propositions from given information.",
+            },
+            {
+                "role": "user",
+                "content": prompt,
+            },
+        ],
+        "response_format": Proposition,
+    }
+
+
+async def extract_proposition_async(executor, entity1, relation, entity2, sentence):
+    """Extract a proposition through the concurrent LLM executor"""
     try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            # model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that extracts propositions from given information.",
-                },
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-            ],
-            response_format=Proposition,
+        proposition = await executor.parse(
+            **extract_proposition_request(entity1, relation, entity2, sentence)
         )
 
-        if completion and completion.choices:
-            proposition = completion.choices[0].message.parsed
+        if proposition:
             return proposition
 
         logging.warning("No valid response received from OpenAI API")
@@ -61,7 +71,87 @@ def extract_proposition(entity1, relation, entity2, sentence):
         return None
 
 
-def process_articles():
+async def extract_relationship_proposition(executor, entity1, relation, entity2, sentence):
+    """Extract the proposition for one relationship of a sentence"""
+    logging.info(
+        f"Extracting proposition for relationship: {entity1} {relation} {entity2}"
+    )
+    proposition = await extract_proposition_async(executor, entity1, relation, entity2, sentence)
+    if proposition:
+        logging.info(f"Extracted proposition: {proposition.proposition}")
+    return proposition
+
+
+def sentence_propositions_fingerprint(sentence, relationships):
+    """Fingerprint a sentence by the proposition requests of all its relationships"""
+    return fingerprint(
+        *(
+            request_fingerprint(extract_proposition_request(entity1, relation, entity2, sentence))
+            for entity1, relation, entity2 in relationships
+        )
+    )
+
+
+async def extract_sentence_propositions(executor, sentence, relationships):
+    """
+    Extract propositions for all relationships of a sentence, keeping their order,
+    with None in place of each proposition that failed.
+    """
+    propositions = await executor.run_in_order(
+        extract_relationship_proposition(executor, entity1, relation, entity2, sentence)
+        for entity1, relation, entity2 in relationships
+    )
+    return [proposition.proposition if proposition else None for proposition in propositions]
+
+
+def is_complete(propositions):
+    """Only sentences where every proposition succeeded are journaled."""
+    return None not in propositions
+
+
+def successful(propositions):
+    return [proposition for proposition in propositions if proposition is not None]
+
+
+async def extract_article_propositions(
+    executor, file_name, sentences_list, relationships_list, journal=None
+):
+    """Extract propositions for all sentences of an article, keeping their order"""
+    logging.info(f"Processing article: {file_name}")
+    relationships_list = [
+        relationships_list[sentence_index] if sentence_index < len(relationships_list) else []
+        for sentence_index in range(len(sentences_list))
+    ]
+    article_propositions = await executor.run_in_order(
+        journaled(
+            journal,
+            sentence_propositions_fingerprint(sentence, relationships),
+            extract_sentence_propositions(executor, sentence, relationships),
+            keep=is_complete,
+        )
+        for sentence, relationships in zip(sentences_list, relationships_list)
+    )
+    # Partial sentences keep their successful propositions in this run's output
+    # but are not journaled, so the next run asks again
+    article_propositions = [successful(propositions) for propositions in article_propositions]
+    logging.info(f"Extracted propositions for {len(article_propositions)} sentences in article: {file_name}")
+    return article_propositions
+
+
+async def extract_articles_propositions(
+    executor, decontextualized_articles, extracted_relationships, journal=None
+):
+    """Extract propositions for every article concurrently"""
+    results = await executor.run_in_order(
+        extract_article_propositions(
+            executor, file_name, sentences_list, extracted_relationships.get(file_name, []), journal
+        )
+        for file_name, sentences_list in decontextualized_articles.items()
+    )
+    return dict(zip(decontextualized_articles, results))
+
+
+def process_articles(batch=False):
     """Process articles and extract propositions"""
     logging.info(
         "Loading decontextualized articles from projects/prls/decontextualized_articles.json"
@@ -88,8 +178,6 @@ def process_articles():
     with open("projects/prls/extracted_relationships.json", "r", encoding="utf-8") as f:
         extracted_relationships = json.load(f)
 
-    all_propositions = {}
-
     total_sentences = sum(
         len(sentences) for sentences in decontextualized_articles.values()
     )
@@ -103,40 +191,31 @@ def process_articles():
     processed_sentences = 0
     total_propositions = 0
 
-    for file_name, sentences_list in list(decontextualized_articles.items())[:]:
-        processed_sentences += len(sentences_list)
-        processed_sentences += len(sentences_list)
-        logging.info(f"Processing article: {file_name}")
-        relationships_list = extracted_relationships.get(file_name, [])
-
-        article_propositions = [[] for _ in sentences_list]
-
-        for sentence_index, sentence in enumerate(sentences_list[:]):
-            relationships = (
-                relationships_list[sentence_index]
-                if sentence_index < len(relationships_list)
-                else []
+    executor = BatchExecutor() if batch else LLMExecutor()
+    with StageJournal("projects/prls/extracted_propositions.json") as journal:
+        all_propositions = executor.run(
+            extract_articles_propositions(
+                executor, decontextualized_articles, extracted_relationships, journal
             )
-            for entity1, relation, entity2 in relationships:
-                logging.info(
-                    f"Extracting proposition for relationship: {entity1} {relation} {entity2}"
-                )
-                proposition = extract_proposition(entity1, relation, entity2, sentence)
-                if proposition:
-                    article_propositions[sentence_index].append(proposition.proposition)
-                    total_propositions += 1
-                    logging.info(f"Extracted proposition: {proposition.proposition}")
-
-        all_propositions[file_name] = article_propositions
-        logging.info(f"Extracted propositions for {len(article_propositions)} sentences in article: {file_name}")
-        logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
-
-    with open("projects/prls/extracted_propositions.json", "w", encoding="utf-8") as f:
-        json.dump(all_propositions, f, indent=4, ensure_ascii=False)
+        )
+    total_propositions = sum(
+        len(propositions)
+        for article_propositions in all_propositions.values()
+        for propositions in article_propositions
+    )
+    logging.info(f"Processed {total_sentences}/{total_sentences} sentences.")
+    logging.info(f"Extracted {total_propositions} propositions.")
+
+    journal.compact(all_propositions)
     logging.info(
         "Successfully extracted propositions into data/extracted_propositions.json"
     )
+    log_cache_stats()
 
 
 if __name__ == "__main__":
-    process_articles()
+    parser = argparse.ArgumentParser(description="Extract propositions")
+    parser.add_argument("--batch", action="store_true", help="run through the OpenAI Batch API")
+    args = parser.parse_args()
+
+    process_articles(batch=args.batch)
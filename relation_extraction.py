@@ -1,16 +1,22 @@
+import argparse
 import json
 import logging
-from openai import OpenAI
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 from pydantic import BaseModel
+from llm_cache import log_cache_stats
+from llm_executor import LLMExecutor, parse_or_none
+from entity_pair_pruning import all_pairs, candidate_pairs, collapse_duplicates, pair_report
+from stage_journal import StageJournal, fingerprint, journaled
 
-# Initialize OpenAI client
-client = OpenAI()
 
+MODEL = "gpt-4o-mini"
+# Relation results depend on several prompts and on earlier answers, so they
+# are journaled by their inputs; bump this whenever one of the prompts changes
+PROMPT_VERSION = 1
 
 class RelationshipValidation(BaseModel):
     is_valid: bool
@@ -22,119 +28,328 @@ class Relationship(BaseModel):
     entity2: str
 
 
-def extract_and_validate_relationships(
-    original_text, paraphrased_text, entities, sentence_index, total_sentences
-):
-    logging.info("Starting relationship extraction and validation")
-    relationships = []
+class Relationships(BaseModel):
+    relationships: list[Relationship]
+
+
+class IndexedRelationshipValidation(BaseModel):
+    index: int
+    is_valid: bool
+
+
+class RelationshipValidations(BaseModel):
+    validations: list[IndexedRelationshipValidation]
+
+
+def extract_relationship_request(original_text, entity1, entity2):
+    """Build the request extracting a candidate relationship between two entities"""
+    relationship_format = Relationship.schema_json(indent=2)
+    extract_prompt = (
+        f"You are an expert in Natural Language Processing techniques. You are doing relation extraction. you are give a text (below) and two entities:\"{entity1['entity']}\" and \"{entity2['entity']}\". As a first step, write an explaination of the relationship between the entities according to the text."
+        f"Next, identify the relationship between \"{entity1['entity']}\" and \"{entity2['entity']}\"."
+        f"## the text:\n \"{original_text}\". "
+        f"## Output format:\n json {relationship_format} ."
+    )
+    return {
+        "stage": "extract_and_validate_relationships",
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant. Your job is to do an NLP task 'relation extraction' between given entities according to a text.",
+            },
+            {
+                "role": "user",
+                "content": extract_prompt,
+            },
+        ],
+        "response_format": Relationship,
+    }
+
+
+def validate_relationship_request(paraphrased_text, entity1, candidate_relation, entity2):
+    """Build the request checking a candidate relationship against the paraphrased text"""
+    validate_prompt = (
+        f"In the paraphrased text: \"{paraphrased_text}\", "
+        f"is the relationship \"{entity1['entity']} {candidate_relation} {entity2['entity']}\" correct? (true/false)"
+    )
+    return {
+        "stage": "extract_and_validate_relationships",
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that extracts and validates relationships between entities.",
+            },
+            {
+                "role": "user",
+                "content": validate_prompt,
+            },
+        ],
+        "response_format": RelationshipValidation,
+    }
+
+
+def oriented_pair(response, entity1, entity2):
+    """Follow the direction the extraction reported when it swapped the two entities"""
+    if (
+        response.entity1.strip() == entity2["entity"]
+        and response.entity2.strip() == entity1["entity"]
+    ):
+        return entity2, entity1
+    return entity1, entity2
+
+
+def extract_relationships_joint_request(original_text, entities):
+    """Build the request extracting the relationships between all entity pairs at once"""
+    relationships_format = Relationships.schema_json(indent=2)
+    entity_names = "\n".join(f"- \"{entity['entity']}\"" for entity in entities)
+    extract_prompt = (
+        f"You are an expert in Natural Language Processing techniques. You are doing relation extraction. you are give a text (below) and a list of entities. "
+        f"For every ordered pair of different entities from the list that the text relates, identify the relationship between them. "
+        f"Use the entity names exactly as they are written in the list and leave out pairs that the text does not relate.\n"
+        f"## Entities:\n{entity_names}\n"
+        f"## the text:\n \"{original_text}\". "
+        f"## Output format:\n json {relationships_format} ."
+    )
+    return {
+        "stage": "extract_and_validate_relationships",
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant. Your job is to do an NLP task 'relation extraction' between given entities according to a text.",
+            },
+            {
+                "role": "user",
+                "content": extract_prompt,
+            },
+        ],
+        "response_format": Relationships,
+    }
+
+
+def validate_relationships_joint_request(paraphrased_text, candidates):
+    """Build the request checking all candidate relationships of a sentence at once"""
+    numbered = "\n".join(
+        f"{index}. \"{entity1} {relation} {entity2}\""
+        for index, (entity1, relation, entity2) in enumerate(candidates)
+    )
+    validate_prompt = (
+        f"In the paraphrased text: \"{paraphrased_text}\", "
+        f"is each of the following relationships correct? (true/false)\n{numbered}\n"
+        f"Answer with one validation per relationship, using its number as the index."
+    )
+    return {
+        "stage": "extract_and_validate_relationships",
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that extracts and validates relationships between entities.",
+            },
+            {
+                "role": "user",
+                "content": validate_prompt,
+            },
+        ],
+        "response_format": RelationshipValidations,
+    }
+
+
+def pair_entities(entities, pairs):
+    """The entities that take part in at least one of the pairs, in sentence order"""
+    names = {entity["entity"] for pair in pairs for entity in pair}
+    return [entity for entity in collapse_duplicates(entities) if entity["entity"] in names]
+
 
-    # Loop over each entity pair (entity1, entity2)
-    for entity1_index, entity1 in enumerate(entities, start=1):
-        for entity2_index, entity2 in enumerate(entities, start=1):
-            if entity1 != entity2:
-                # Step 3A: Extract candidate relationship from original text
-                relationship_format = Relationship.schema_json(indent=2)
-                extract_prompt = (
-                    f"You are an expert in Natural Language Processing techniques. You are doing relation extraction. you are give a text (below) and two entities:\"{entity1['entity']}\" and \"{entity2['entity']}\". As a first step, write an explaination of the relationship between the entities according to the text."
-                    f"Next, identify the relationship between \"{entity1['entity']}\" and \"{entity2['entity']}\"."
-                    f"## the text:\n \"{original_text}\". "
-                    f"## Output format:\n json {relationship_format} ."
-                )
-                logging.info(
-                    f"Extracting relationship between {entity1['entity']} (entity {entity1_index}/{len(entities)}) and {entity2['entity']} (entity {entity2_index}/{len(entities)}) in sentence {sentence_index}/{total_sentences}"
-                )
-                response = client.beta.chat.completions.parse(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a helpful assistant. Your job is to do an NLP task 'relation extraction' between given entities according to a text.",
-                        },
-                        {
-                            "role": "user",
-                            "content": extract_prompt,
-                        },
-                    ],
-                    response_format=Relationship,
-                )
-                candidate_relation_response = (
-                    response.choices[0].message.parsed
-                    if response and response.choices
-                    else None
-                )
-                if candidate_relation_response:
-                    candidate_relation = candidate_relation_response.relation
-                else:
-                    candidate_relation = ""
-
-                # Proceed only if a relationship was identified
-                if candidate_relation:
-                    # Step 3B: Validate the relationship in the paraphrased text
-                    validate_prompt = (
-                        f"In the paraphrased text: \"{paraphrased_text}\", "
-                        f"is the relationship \"{entity1['entity']} {candidate_relation} {entity2['entity']}\" correct? (true/false)"
-                    )
-                    logging.info(
-                        f"Validating relationship: {entity1['entity']} {candidate_relation} {entity2['entity']}"
-                    )
-                    response = client.beta.chat.completions.parse(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "You are a helpful assistant that extracts and validates relationships between entities.",
-                            },
-                            {
-                                "role": "user",
-                                "content": validate_prompt,
-                            },
-                        ],
-                        response_format=RelationshipValidation,
-                    )
-                    validation = None
-                    if response and response.choices:
-                        parsed_response = response.choices[0].message.parsed
-                        if parsed_response:
-                            validation = parsed_response.is_valid
-
-                    # If validated, add to the final relationships
-                    if validation:
-                        relationships.append((
-                            entity1["entity"],
-                            candidate_relation,
-                            entity2["entity"],
-                        ))
-
-    logging.info("Completed relationship extraction and validation")
+def joint_candidates(response, entities, pairs=None):
+    """
+    Keep the extracted relationships whose entities are two different entities
+    of the sentence, ordered like the pairwise loop would produce them. When
+    candidate pairs are given, only relationships between them are kept.
+    """
+    order = {}
+    for index, entity in enumerate(entities):
+        order.setdefault(entity["entity"], index)
+    allowed = None
+    if pairs is not None:
+        allowed = {frozenset([e1["entity"], e2["entity"]]) for e1, e2 in pairs}
+    candidates = []
+    for relationship in response.relationships if response else []:
+        entity1 = relationship.entity1.strip()
+        entity2 = relationship.entity2.strip()
+        relation = relationship.relation.strip()
+        if (
+            relation
+            and entity1 in order
+            and entity2 in order
+            and entity1 != entity2
+            and (allowed is None or frozenset([entity1, entity2]) in allowed)
+            and (entity1, relation, entity2) not in candidates
+        ):
+            candidates.append((entity1, relation, entity2))
+    return sorted(candidates, key=lambda c: (order[c[0]], order[c[2]]))
+
+
+def joint_validated(response, candidates):
+    """Return the candidates the validation response marked as valid"""
+    valid = set()
+    for validation in response.validations if response else []:
+        if validation.is_valid:
+            valid.add(validation.index)
+    return [
+        candidate for index, candidate in enumerate(candidates) if index in valid
+    ]
+
+
+async def extract_and_validate_relationships_joint_async(
+    executor, original_text, paraphrased_text, entities, sentence_index, total_sentences, pairs=None
+):
+    """
+    Extract all relationships of a sentence in one call and validate them in one more.
+    Returns None if either request failed, so the sentence is retried on the next run.
+    """
+    logging.info(
+        f"Extracting relationships between {len(entities)} entities in sentence {sentence_index}/{total_sentences}"
+    )
+    if pairs is not None:
+        entities = pair_entities(entities, pairs)
+    if len(entities) < 2:
+        return []
+    extracted = await parse_or_none(
+        executor, extract_relationships_joint_request(original_text, entities), "extracting relationships"
+    )
+    if extracted is None:
+        return None
+    candidates = joint_candidates(extracted, entities, pairs)
+    if not candidates:
+        return []
+    logging.info(f"Validating {len(candidates)} relationships")
+    validations = await parse_or_none(
+        executor, validate_relationships_joint_request(paraphrased_text, candidates), "validating relationships"
+    )
+    if validations is None:
+        return None
+    relationships = joint_validated(validations, candidates)
+    logging.info(f"Extracted {len(relationships)} relationships for sentence {sentence_index}.")
     return relationships
 
 
-def process_articles():
-    # Load data from JSON files
+async def extract_and_validate_pair_async(
+    executor, original_text, paraphrased_text, entity1, entity2
+):
+    """
+    Extract and validate the relationship between one entity pair. Returns the
+    validated relationships of the pair (none or one), or None if a request failed.
+    """
+    # Step 3A: Extract candidate relationship from original text
+    candidate_relation_response = await parse_or_none(
+        executor, extract_relationship_request(original_text, entity1, entity2), "extracting a relationship"
+    )
+    if candidate_relation_response is None:
+        return None
+    if not candidate_relation_response.relation:
+        return []
+    candidate_relation = candidate_relation_response.relation
+    entity1, entity2 = oriented_pair(candidate_relation_response, entity1, entity2)
+
+    # Step 3B: Validate the relationship in the paraphrased text
     logging.info(
-        "Loading decontextualized articles from projects/prls/decontextualized_articles.json"
+        f"Validating relationship: {entity1['entity']} {candidate_relation} {entity2['entity']}"
     )
-    with open("projects/prls/decontextualized_articles.json", "r", encoding="utf-8") as f:
-        decontextualized_articles = json.load(f)
+    parsed_response = await parse_or_none(
+        executor,
+        validate_relationship_request(paraphrased_text, entity1, candidate_relation, entity2),
+        "validating a relationship",
+    )
+    if parsed_response is None:
+        return None
+    if not parsed_response.is_valid:
+        return []
+    return [(entity1["entity"], candidate_relation, entity2["entity"])]
 
-    logging.info("Loading paraphrased articles from projects/prls/paraphrased_articles.json")
-    with open("projects/prls/paraphrased_articles.json", "r", encoding="utf-8") as f:
-        paraphrased_articles = json.load(f)
 
-    logging.info("Loading extracted entities from projects/prls/extracted_entities.json")
-    with open("projects/prls/extracted_entities.json", "r", encoding="utf-8") as f:
-        extracted_entities = json.load(f)
+async def extract_and_validate_relationships_async(
+    executor, original_text, paraphrased_text, entities, sentence_index, total_sentences, pairs=None
+):
+    """
+    Extract and validate the relationships of all entity pairs of a sentence
+    concurrently. Returns None if any pair failed, so a partial list is never journaled.
+    """
+    logging.info(
+        f"Starting relationship extraction and validation for sentence {sentence_index}/{total_sentences}"
+    )
+    if pairs is None:
+        pairs = all_pairs(entities)
+    results = await executor.run_in_order(
+        extract_and_validate_pair_async(
+            executor, original_text, paraphrased_text, entity1, entity2
+        )
+        for entity1, entity2 in pairs
+    )
+    if any(pair_relationships is None for pair_relationships in results):
+        return None
+    relationships = []
+    for pair_relationships in results:
+        for relationship in pair_relationships:
+            if relationship not in relationships:
+                relationships.append(relationship)
+    logging.info(f"Extracted {len(relationships)} relationships for sentence {sentence_index}.")
+    return relationships
 
-    all_relationships = {}
 
-    total_sentences = sum(len(sentences) for sentences in decontextualized_articles.values())
-    processed_sentences = 0
-    total_relationships = 0
+async def extract_article_relationships(
+    executor, file_name, sentences_list, paraphrased_sentences, entities_list, mode="pairwise", prune=False, journal=None
+):
+    """
+    Extract relationships for all sentences of an article, keeping their order.
+    With prune, only the candidate pairs that survive entity_pair_pruning are prompted.
+    """
+    extract = (
+        extract_and_validate_relationships_joint_async
+        if mode == "joint"
+        else extract_and_validate_relationships_async
+    )
+    article_relationships = await executor.run_in_order(
+        journaled(
+            journal,
+            fingerprint(
+                PROMPT_VERSION,
+                MODEL,
+                mode,
+                prune,
+                original_sentence,
+                paraphrased_sentences[sentence_index - 1],
+                entities_list[sentence_index - 1],
+            ),
+            extract(
+                executor,
+                original_sentence,
+                paraphrased_sentences[sentence_index - 1],
+                entities_list[sentence_index - 1],
+                sentence_index,
+                len(sentences_list),
+                candidate_pairs(entities_list[sentence_index - 1], original_sentence)
+                if prune
+                else None,
+            ),
+        )
+        for sentence_index, original_sentence in enumerate(sentences_list, start=1)
+    )
+    # Failed sentences are not journaled; they get no relationships in this run's output
+    return [relationships if relationships is not None else [] for relationships in article_relationships]
+
 
+async def extract_articles_relationships(
+    executor, decontextualized_articles, paraphrased_articles, extracted_entities, mode="pairwise", prune=False, journal=None
+):
+    """Extract relationships for every article concurrently"""
+    file_names = []
+    tasks = []
     for file_index, (file_name, sentences_list) in enumerate(
         decontextualized_articles.items(), start=1
     ):
-        processed_sentences += len(sentences_list)
         logging.info(
             f"Processing article {file_index}/{len(decontextualized_articles)}: {file_name}"
         )
@@ -151,40 +366,88 @@ def process_articles():
             )
             continue
 
-        article_relationships = []
-
-        for sentence_index, original_sentence in enumerate(sentences_list[:], start=1):
-            entities = entities_list[sentence_index - 1]
-            logging.info(
-                f"Processing sentence {sentence_index}/{len(sentences_list)} in article: {file_name} with entities: {[entity['entity'] for entity in entities]}"
+        file_names.append(file_name)
+        tasks.append(
+            extract_article_relationships(
+                executor, file_name, sentences_list, paraphrased_sentences, entities_list, mode, prune, journal
             )
-            paraphrased_sentence = paraphrased_sentences[sentence_index - 1]
-            entities = entities_list[sentence_index - 1]
-            relationships = extract_and_validate_relationships(
-                original_sentence,
-                paraphrased_sentence,
-                entities,
-                sentence_index,
-                len(sentences_list),
-            )
-            article_relationships.append(relationships)
-            total_relationships += len(relationships)
-            logging.info(f"Extracted {len(relationships)} relationships for sentence {sentence_index}.")
+        )
+
+    results = await executor.run_in_order(tasks)
+    return dict(zip(file_names, results))
 
-        all_relationships[file_name] = article_relationships
-        logging.info(f"Extracted relationships for {len(article_relationships)} sentences in article: {file_name}")
-        logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
+
+def process_articles(mode="pairwise", prune=False):
+    """
+    Extract and validate relationships for every sentence.
+    mode="pairwise" prompts once per ordered entity pair; mode="joint"
+    extracts all relationships of a sentence in one call and validates
+    them in one more. prune drops hopeless entity pairs before any call.
+    """
+    # Load data from JSON files
+    logging.info(
+        "Loading decontextualized articles from projects/prls/decontextualized_articles.json"
+    )
+    with open("projects/prls/decontextualized_articles.json", "r", encoding="utf-8") as f:
+        decontextualized_articles = json.load(f)
+
+    logging.info("Loading paraphrased articles from projects/prls/paraphrased_articles.json")
+    with open("projects/prls/paraphrased_articles.json", "r", encoding="utf-8") as f:
+        paraphrased_articles = json.load(f)
+
+    logging.info("Loading extracted entities from projects/prls/extracted_entities.json")
+    with open("projects/prls/extracted_entities.json", "r", encoding="utf-8") as f:
+        extracted_entities = json.load(f)
+
+    total_sentences = sum(len(sentences) for sentences in decontextualized_articles.values())
+
+    if prune:
+        # Recall needs an unpruned run to compare against; entity_pair_pruning.py reports it
+        report = pair_report(decontextualized_articles, extracted_entities)
+        logging.info(
+            f"Pruned entity pairs to {report['kept_pairs']}/{report['total_pairs']} ({report['pruning_ratio']:.1%} pruned)."
+        )
+
+    executor = LLMExecutor()
+    with StageJournal("projects/prls/extracted_relationships.json") as journal:
+        all_relationships = executor.run(
+            extract_articles_relationships(
+                executor, decontextualized_articles, paraphrased_articles, extracted_entities, mode, prune, journal
+            )
+        )
+    processed_sentences = sum(
+        len(decontextualized_articles[file_name]) for file_name in all_relationships
+    )
+    total_relationships = sum(
+        len(relationships)
+        for article_relationships in all_relationships.values()
+        for relationships in article_relationships
+    )
 
     # Save the relationships to a JSON file
     logging.info("Saving extracted relationships to projects/prls/extracted_relationships.json")
-    with open("projects/prls/extracted_relationships.json", "w", encoding="utf-8") as f:
-        json.dump(all_relationships, f, indent=2, ensure_ascii=False)
+    journal.compact(all_relationships, indent=2)
     logging.info(f"Processed {processed_sentences}/{total_sentences} sentences.")
     logging.info(f"Extracted a total of {total_relationships} relationships.")
+    log_cache_stats()
     print(
         "Successfully extracted and validated relationships into data/extracted_relationships.json"
     )
 
 
 if __name__ == "__main__":
-    process_articles()
+    parser = argparse.ArgumentParser(description="Extract and validate relationships")
+    parser.add_argument(
+        "--mode",
+        choices=["pairwise", "joint"],
+        default="pairwise",
+        help="one prompt per entity pair, or one extraction and one validation prompt per sentence",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="drop mirror, type-incompatible, distant and duplicate entity pairs first",
+    )
+    args = parser.parse_args()
+
+    process_articles(mode=args.mode, prune=args.prune)
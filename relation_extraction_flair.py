@@ -1,36 +1,71 @@
+import argparse
 import json
 import logging
 from pydantic import BaseModel
 from flair.data import Sentence
-from flair.nn import Classifier
-from openai import OpenAI
+from flair_batching import MINI_BATCH_SIZE
+from flair_pool import predict_articles
+from llm_cache import log_cache_stats
+from llm_executor import LLMExecutor, parse_or_none
+from model_registry import get_flair
+from stage_journal import StageJournal, fingerprint, journaled
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-# Initialize OpenAI client
-client = OpenAI()
+MODEL = "gpt-4o-mini"
+# Bump whenever the validation prompt or the Flair model changes so that
+# journaled results are recomputed
+PROMPT_VERSION = 2
 
 class RelationshipValidation(BaseModel):
     is_valid: bool
 
-# Load the Flair relation extractor
-relation_extractor = Classifier.load('relations')
+RELATION_MODEL = "relations"
+# The relation model pairs up "ner" spans through entity pair filters written
+# for the CoNLL tags (PER, ORG, LOC, MISC), so it runs after the CoNLL tagger
+RELATION_NER_MODEL = "ner"
+RELATION_MODELS = (RELATION_NER_MODEL, RELATION_MODEL)
 
 
-def extract_and_validate_relationships(
-    original_text, paraphrased_text, entities, sentence_index, total_sentences
-):
-    logging.info("Starting relationship extraction and validation")
-    relationships = []
-
-    # Use Flair to extract relationships
+def validate_relationship_request(paraphrased_text, entity1, candidate_relation, entity2):
+    """Build the request checking a Flair relationship against the paraphrased text"""
+    validate_prompt = (
+        f"In the paraphrased text: \"{paraphrased_text}\", "
+        f"is the relationship \"{entity1} {candidate_relation} {entity2}\" correct? (true/false)"
+    )
+    return {
+        "stage": "extract_and_validate_relationships",
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that extracts and validates relationships between entities.",
+            },
+            {
+                "role": "user",
+                "content": validate_prompt,
+            },
+        ],
+        "response_format": RelationshipValidation,
+    }
+
+
+def extract_flair_relations(original_text):
+    """Extract (entity1, relation, entity2) candidates from a sentence using Flair"""
     sentence = Sentence(original_text)
-    relation_extractor.predict(sentence)
+    for model_name in RELATION_MODELS:
+        get_flair(model_name).predict(sentence)
+    return sentence_relations(sentence)
+
+
+def sentence_relations(sentence):
+    """Read (entity1, relation, entity2) candidates off a predicted Flair sentence"""
     flair_relations = sentence.get_labels('relation')
 
+    candidates = []
     for relation in flair_relations:
         # Extract the entities and the relation
         entity1 = relation.head.text
@@ -39,48 +74,85 @@ def extract_and_validate_relationships(
         logging.info(
             f"Extracted relationship using Flair: {entity1} {candidate_relation} {entity2}"
         )
+        candidates.append((entity1, candidate_relation, entity2))
+    return candidates
 
-        # Validate the relationship in the paraphrased text using OpenAI
-        validate_prompt = (
-            f"In the paraphrased text: \"{paraphrased_text}\", "
-            f"is the relationship \"{entity1} {candidate_relation} {entity2}\" correct? (true/false)"
-        )
-        logging.info(
-            f"Validating relationship: {entity1} {candidate_relation} {entity2}"
-        )
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that extracts and validates relationships between entities.",
-                },
-                {
-                    "role": "user",
-                    "content": validate_prompt,
-                },
-            ],
-            response_format=RelationshipValidation,
+
+async def validate_relationship_async(
+    executor, paraphrased_text, entity1, candidate_relation, entity2
+):
+    """
+    Validate one Flair relationship through the concurrent LLM executor.
+    Returns the relationship, False if it is not valid, or None if the request failed.
+    """
+    logging.info(
+        f"Validating relationship: {entity1} {candidate_relation} {entity2}"
+    )
+    parsed_response = await parse_or_none(
+        executor,
+        validate_relationship_request(paraphrased_text, entity1, candidate_relation, entity2),
+        "validating a relationship",
+    )
+    if parsed_response is None:
+        return None
+    return (entity1, candidate_relation, entity2) if parsed_response.is_valid else False
+
+
+async def extract_and_validate_relationships_async(
+    executor, original_text, paraphrased_text, entities, sentence_index, total_sentences, candidates=None
+):
+    """
+    Extract relationships with Flair and validate them concurrently.
+    candidates are the Flair relations of the sentence when they were already
+    predicted in a batch. Returns None if any validation failed.
+    """
+    logging.info(
+        f"Starting relationship extraction and validation for sentence {sentence_index}/{total_sentences}"
+    )
+    if candidates is None:
+        candidates = extract_flair_relations(original_text)
+    results = await executor.run_in_order(
+        validate_relationship_async(
+            executor, paraphrased_text, entity1, candidate_relation, entity2
         )
-        validation = None
-        if response and response.choices:
-            parsed_response = response.choices[0].message.parsed
-            if parsed_response:
-                validation = parsed_response.is_valid
+        for entity1, candidate_relation, entity2 in candidates
+    )
+    if any(relationship is None for relationship in results):
+        return None
+    return [relationship for relationship in results if relationship]
 
-        # If validated, add to the final relationships
-        if validation:
-            relationships.append((
-                entity1,
-                candidate_relation,
-                entity2,
-            ))
 
-    logging.info("Completed relationship extraction and validation")
-    return relationships
+async def extract_article_relationships(
+    executor, file_name, sentences_list, paraphrased_sentences, entities_list, journal=None, candidates_list=None
+):
+    """Extract relationships for all sentences of an article, keeping their order"""
+    article_relationships = await executor.run_in_order(
+        journaled(
+            journal,
+            fingerprint(
+                PROMPT_VERSION,
+                MODEL,
+                original_sentence,
+                paraphrased_sentences[sentence_index - 1],
+                entities_list[sentence_index - 1],
+            ),
+            extract_and_validate_relationships_async(
+                executor,
+                original_sentence,
+                paraphrased_sentences[sentence_index - 1],
+                entities_list[sentence_index - 1],
+                sentence_index,
+                len(sentences_list),
+                candidates_list[sentence_index - 1] if candidates_list else None,
+            ),
+        )
+        for sentence_index, original_sentence in enumerate(sentences_list, start=1)
+    )
+    # Failed sentences are not journaled; they get no relationships in this run's output
+    return [relationships if relationships is not None else [] for relationships in article_relationships]
 
 
-def process_articles():
+def process_articles(mini_batch_size=MINI_BATCH_SIZE, workers=1, candidates_file=None):
     # Load data from JSON files
     logging.info(
         "Loading decontextualized articles from projects/prls/decontextualized_articles.json"
@@ -96,7 +168,9 @@ def process_articles():
     with open("projects/prls/extracted_entities.json", "r", encoding="utf-8") as f:
         extracted_entities = json.load(f)
 
-    all_relationships = {}
+    executor = LLMExecutor()
+    journal = StageJournal("projects/prls/extracted_relationships_flair.json")
+    articles = {}
 
     for file_index, (file_name, sentences_list) in enumerate(
         decontextualized_articles.items(), start=1
@@ -117,34 +191,52 @@ def process_articles():
             )
             continue
 
-        article_relationships = []
-
-        for sentence_index, original_sentence in enumerate(sentences_list, start=1):
-            entities = entities_list[sentence_index - 1]
-            logging.info(
-                f"Processing sentence {sentence_index}/{len(sentences_list)} in article: {file_name} with entities: {[entity['entity'] for entity in entities]}"
-            )
-            paraphrased_sentence = paraphrased_sentences[sentence_index - 1]
-            entities = entities_list[sentence_index - 1]
-            relationships = extract_and_validate_relationships(
-                original_sentence,
-                paraphrased_sentence,
-                entities,
-                sentence_index,
-                len(sentences_list),
-            )
-            article_relationships.append(relationships)
+        articles[file_name] = sentences_list
+
+    # Run the Flair relation extractor over all sentences in mini-batches first
+    if candidates_file:
+        # Relations already tagged, e.g. by flair_annotate.py
+        logging.info(f"Loading Flair relations from {candidates_file}")
+        with open(candidates_file, "r", encoding="utf-8") as f:
+            candidates = json.load(f)
+    else:
+        logging.info(f"Extracting Flair relations from {sum(len(s) for s in articles.values())} sentences")
+        candidates = predict_articles(
+            RELATION_MODELS, articles, sentence_relations, workers=workers, mini_batch_size=mini_batch_size
+        )
 
-        all_relationships[file_name] = article_relationships
+    tasks = [
+        extract_article_relationships(
+            executor,
+            file_name,
+            sentences_list,
+            paraphrased_articles[file_name]["paraphrased_sentences"],
+            extracted_entities[file_name],
+            journal,
+            candidates[file_name],
+        )
+        for file_name, sentences_list in articles.items()
+    ]
+    with journal:
+        results = executor.run(executor.run_in_order(tasks))
+    all_relationships = dict(zip(articles, results))
 
     # Save the relationships to a JSON file
     logging.info("Saving extracted relationships to projects/prls/extracted_relationships_flair.json")
-    with open("projects/prls/extracted_relationships_flair.json", "w", encoding="utf-8") as f:
-        json.dump(all_relationships, f, indent=2, ensure_ascii=False)
+    journal.compact(all_relationships, indent=2)
+    log_cache_stats()
     print(
         "Successfully extracted and validated relationships into data/extracted_relationships.json"
     )
 
 
 if __name__ == "__main__":
-    process_articles()
+    parser = argparse.ArgumentParser(description="Extract relationships with Flair and validate them")
+    parser.add_argument("--mini-batch-size", type=int, default=MINI_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the Flair relation extractor")
+    parser.add_argument("--candidates", help="use Flair relations written by flair_annotate.py instead of tagging again")
+    args = parser.parse_args()
+
+    process_articles(
+        mini_batch_size=args.mini_batch_size, workers=args.workers, candidates_file=args.candidates
+    )
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from llm_cache import request_key
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# fsync the journal after this many records or seconds, whichever comes first
+FSYNC_EVERY = 50
+FSYNC_INTERVAL = 5.0
+
+
+def fingerprint(*parts):
+    """Hash JSON-serializable inputs of a sentence into a journal key."""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def request_fingerprint(request):
+    """
+    Fingerprint a single-request stage by its request: the prompt carries the
+    sentence text, upstream outputs and prompt version, next to the model.
+    """
+    return request_key(request["model"], request["messages"], request.get("response_format"))
+
+
+class StageJournal:
+    """
+    Append-only JSONL journal of per-sentence results of a stage, keyed by a
+    fingerprint of everything the result depends on.
+    Results are written as soon as they are done, so a crash or Ctrl-C only
+    loses the work in flight. The journal is kept between runs: a rerun reuses
+    every sentence whose fingerprint is unchanged and recomputes the rest, and
+    anything downstream of a change gets a new fingerprint in turn.
+    compact() writes the final JSON and drops results no longer in use.
+    """
+
+    def __init__(self, output_file, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.output_file = Path(output_file)
+        self.path = self.output_file.with_name(self.output_file.name + ".journal.jsonl")
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.results = self.load()
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.used = set()
+        self.reused = 0
+        self.computed = 0
+        if self.results:
+            logging.info(f"Loaded {len(self.results)} sentence results from {self.path}")
+
+    def load(self):
+        """Replay the journal; a torn last line from a crash is ignored."""
+        results = {}
+        if not self.path.exists():
+            return results
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping incomplete journal line in {self.path}")
+                    continue
+                results[record["key"]] = record["result"]
+        return results
+
+    def record(self, key, result):
+        """Append a finished result and fsync in batches."""
+        self.results[key] = result
+        self.file.write(json.dumps({"key": key, "result": result}, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if (
+            self.unsynced >= self.fsync_every
+            or time.monotonic() - self.synced_at >= self.fsync_interval
+        ):
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    async def run(self, key, coroutine, keep=None):
+        """
+        Return the journaled result for key, or await the coroutine and journal
+        its result. keep, if given, decides which non-None results are complete
+        enough to journal; the others are returned but not kept.
+        """
+        self.used.add(key)
+        if key in self.results:
+            coroutine.close()
+            self.reused += 1
+            return self.results[key]
+        result = await coroutine
+        self.computed += 1
+        # Failed sentences (None) are not journaled, so a rerun retries them;
+        # stages must return None for any failure, or pass keep to reject partial results
+        if result is not None and (keep is None or keep(result)):
+            self.record(key, result)
+        return result
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def compact(self, data, indent=4):
+        """Atomically write the final JSON output and rewrite the journal with the results in use."""
+        self.close()
+        write_atomically(
+            self.output_file,
+            lambda f: json.dump(data, f, indent=indent, ensure_ascii=False),
+        )
+        write_atomically(
+            self.path,
+            lambda f: f.writelines(
+                json.dumps({"key": key, "result": self.results[key]}, ensure_ascii=False) + "\n"
+                for key in self.results
+                if key in self.used
+            ),
+        )
+        logging.info(
+            f"Reused {self.reused} sentence results and computed {self.computed}; saved {self.output_file}"
+        )
+
+
+def write_atomically(path, write):
+    """Write a file through a temporary file and an atomic replace."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+async def journaled(journal, key, coroutine, keep=None):
+    """Run a per-sentence coroutine through the journal when there is one."""
+    if journal is None:
+        return await coroutine
+    return await journal.run(key, coroutine, keep)
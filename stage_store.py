@@ -0,0 +1,128 @@
+import argparse
+import json
+import logging
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+STORE_FILE = "stage_outputs.parquet"
+# Sentences per row group; readers stream one row group at a time
+ROW_GROUP_SIZE = 16384
+
+# One row per (article, sentence); every stage output is a column
+SCHEMA = pa.schema(
+    [
+        ("article", pa.string()),
+        ("sentence_idx", pa.int32()),
+        ("sentence", pa.string()),
+        ("entities", pa.list_(pa.struct([("entity", pa.string()), ("type", pa.string())]))),
+        (
+            "relationships",
+            pa.list_(pa.struct([("entity1", pa.string()), ("relation", pa.string()), ("entity2", pa.string())])),
+        ),
+        ("propositions", pa.list_(pa.string())),
+        ("atomic_facts", pa.list_(pa.string())),
+    ]
+)
+
+# Stage output file of each list column
+STAGE_FILES = {
+    "entities": "extracted_entities.json",
+    "relationships": "extracted_relationships.json",
+    "propositions": "extracted_propositions.json",
+    "atomic_facts": "extracted_atomic_facts.json",
+}
+
+
+def load_stage(project_dir, file_name):
+    """Load a stage output of the project, or an empty dict when the stage has not run."""
+    path = Path(project_dir) / file_name
+    if not path.is_file():
+        logging.info(f"No {path}; its column stays empty")
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def triple_structs(relationships):
+    return [
+        {"entity1": entity1, "relation": relation, "entity2": entity2}
+        for entity1, relation, entity2 in relationships
+    ]
+
+
+def triple_lists(relationships):
+    """Turn stored relationships back into the [entity1, relation, entity2] lists of the JSON outputs."""
+    return [[r["entity1"], r["relation"], r["entity2"]] for r in relationships]
+
+
+def stage_rows(project_dir):
+    """Yield one row per decontextualized sentence with every stage's output for it."""
+    sentences = load_stage(project_dir, "decontextualized_articles.json")
+    stages = {column: load_stage(project_dir, file_name) for column, file_name in STAGE_FILES.items()}
+    for file_name, article_sentences in sentences.items():
+        outputs = {column: stage.get(file_name, []) for column, stage in stages.items()}
+        for i, sentence in enumerate(article_sentences):
+            row = {"article": file_name, "sentence_idx": i, "sentence": sentence}
+            for column, values in outputs.items():
+                row[column] = values[i] if i < len(values) else None
+            if row["relationships"] is not None:
+                row["relationships"] = triple_structs(row["relationships"])
+            yield row
+
+
+def write_store(project_dir, output_file=None, row_group_size=ROW_GROUP_SIZE):
+    """Write the stage outputs of a project into one Parquet file, a row group at a time."""
+    output_file = output_file or Path(project_dir) / STORE_FILE
+    count = 0
+    rows = []
+    with pq.ParquetWriter(output_file, SCHEMA) as writer:
+        for row in stage_rows(project_dir):
+            rows.append(row)
+            if len(rows) == row_group_size:
+                writer.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), row_group_size)
+                count += len(rows)
+                rows = []
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), row_group_size)
+            count += len(rows)
+    logging.info(f"Stored {count} sentences in {output_file}")
+    return output_file
+
+
+def read_store(path, columns=None):
+    """Memory-map the store and read only the given columns as an Arrow table."""
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+def iter_articles(path, columns):
+    """
+    Stream (file_name, rows) per article from the store, reading only `columns`
+    (plus the article column) one row group at a time.
+    """
+    columns = ["article"] + [column for column in columns if column != "article"]
+    store = pq.ParquetFile(path, memory_map=True)
+    current, rows = None, []
+    for batch in store.iter_batches(columns=columns):
+        for row in batch.to_pylist():
+            if row["article"] != current:
+                if rows:
+                    yield current, rows
+                current, rows = row["article"], []
+            rows.append(row)
+    if rows:
+        yield current, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store a project's stage outputs as one Parquet file")
+    parser.add_argument("--project", default="projects/prls", help="project directory")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    write_store(args.project, row_group_size=args.row_group_size)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from chunking_check import check_articles
+from extract_atomic_facts import extract_article_atomic_facts
+from proposition_extraction import extract_article_propositions
+from relation_extraction import extract_article_relationships
+from stage_journal import StageJournal
+
+
+class FlakyExecutor:
+    """Executor whose first `failures` requests raise, like a 429 or a timeout, and the rest answer."""
+
+    def __init__(self, failures, answer):
+        self.failures = failures
+        self.answer = answer
+        self.calls = 0
+
+    async def parse(self, **request):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise TimeoutError("request timed out")
+        return self.answer(request)
+
+    async def run_in_order(self, coroutines):
+        return await asyncio.gather(*coroutines)
+
+
+def run_twice(tmp_path, run, first, second):
+    """Run a stage with the journal, then again with a fresh journal over the same file."""
+    output_file = tmp_path / "output.json"
+    results = []
+    for executor in (first, second):
+        with StageJournal(output_file) as journal:
+            result = asyncio.run(run(executor, journal))
+        journal.compact(result)
+        results.append(result)
+    return results, json.loads(output_file.read_text(encoding="utf-8"))
+
+
+def test_failed_atomic_facts_are_retried(tmp_path):
+    sentences = ["Elon Musk sued OpenAI.", "OpenAI denied the claims."]
+    answer = lambda request: SimpleNamespace(facts=["a fact"])
+
+    def run(executor, journal):
+        return extract_article_atomic_facts(executor, "article", sentences, [[], []], journal)
+
+    first, second = FlakyExecutor(failures=1, answer=answer), FlakyExecutor(failures=0, answer=answer)
+    (failed, retried), saved = run_twice(tmp_path, run, first, second)
+
+    assert sorted(map(len, failed)) == [0, 1]
+    assert retried == [["a fact"], ["a fact"]]
+    assert saved == retried
+    # Only the sentence that failed is asked again
+    assert second.calls == 1
+
+
+def test_partial_propositions_are_retried(tmp_path):
+    sentences = ["Elon Musk sued OpenAI and Sam Altman."]
+    relationships = [[["Elon Musk", "sued", "OpenAI"], ["Elon Musk", "sued", "Sam Altman"]]]
+    answer = lambda request: SimpleNamespace(proposition="a proposition")
+
+    def run(executor, journal):
+        return extract_article_propositions(executor, "article", sentences, relationships, journal)
+
+    first, second = FlakyExecutor(failures=1, answer=answer), FlakyExecutor(failures=0, answer=answer)
+    (failed, retried), _ = run_twice(tmp_path, run, first, second)
+
+    # The successful proposition is written, but the sentence is not journaled
+    assert failed == [["a proposition"]]
+    assert retried == [["a proposition", "a proposition"]]
+    assert second.calls == 2
+
+
+def relation_answer(request):
+    if request["response_format"].__name__ == "Relationship":
+        return SimpleNamespace(entity1="Elon Musk", relation="sued", entity2="OpenAI")
+    if request["response_format"].__name__ == "Relationships":
+        return SimpleNamespace(
+            relationships=[SimpleNamespace(entity1="Elon Musk", relation="sued", entity2="OpenAI")]
+        )
+    if request["response_format"].__name__ == "RelationshipValidations":
+        return SimpleNamespace(validations=[SimpleNamespace(index=0, is_valid=True)])
+    return SimpleNamespace(is_valid=True)
+
+
+@pytest.mark.parametrize("mode", ["pairwise", "joint"])
+def test_failed_relationships_are_retried(tmp_path, mode):
+    sentences = ["Elon Musk sued OpenAI.", "Elon Musk sued OpenAI again."]
+    entities = [[{"entity": "Elon Musk", "type": "PER"}, {"entity": "OpenAI", "type": "ORG"}]] * 2
+
+    def run(executor, journal):
+        return extract_article_relationships(
+            executor, "article", sentences, sentences, entities, mode, journal=journal
+        )
+
+    first = FlakyExecutor(failures=1, answer=relation_answer)
+    second = FlakyExecutor(failures=0, answer=relation_answer)
+    (failed, _), saved = run_twice(tmp_path, run, first, second)
+
+    # One failed request costs its own sentence, not the run
+    assert sorted(map(len, failed)) == [0, 1]
+    assert saved == [[["Elon Musk", "sued", "OpenAI"]]] * 2
+    assert 0 < second.calls < first.calls
+
+
+def test_failed_chunk_checks_are_retried(tmp_path):
+    chunked_articles = {"article": ["Elon Musk sued OpenAI."]}
+    answer = lambda request: "Yes"
+
+    def run(executor, journal):
+        return check_articles(executor, chunked_articles, journal)
+
+    first, second = FlakyExecutor(failures=1, answer=answer), FlakyExecutor(failures=0, answer=answer)
+    (failed, retried), _ = run_twice(tmp_path, run, first, second)
+
+    assert failed["article"][0]["check_result"] is None
+    assert retried["article"][0]["check_result"] == "Yes"
+    assert second.calls == 1
@@ -1,11 +1,16 @@
+import argparse
 import json
 import logging
-from flair.nn import Classifier
-from flair.splitter import SegtokSentenceSplitter
+from chunkers import split_windows
+
+# Characters read per window when streaming
+WINDOW_SIZE = 1 << 20
 
 
 def split_text_into_sentences(input_file, output_file):
     """Process articles and split them into sentences using Flair"""
+    from flair.splitter import SegtokSentenceSplitter
+
     with open(input_file, "r", encoding="utf-8") as f:
         text = f.read()
 
@@ -28,7 +33,44 @@ def split_text_into_sentences(input_file, output_file):
     print(f"Successfully chunked articles into {output_file}")
 
 
+def read_windows(f, window_size=WINDOW_SIZE):
+    """Read an open text file in windows of window_size characters."""
+    while True:
+        window = f.read(window_size)
+        if not window:
+            return
+        yield window
+
+
+def stream_text_into_sentences(input_file, output_file, window_size=WINDOW_SIZE):
+    """
+    Split a text file of any size into sentences with the rule-based splitter,
+    reading it in windows and writing one JSON line per sentence as it goes.
+    """
+    count = 0
+    with open(input_file, "r", encoding="utf-8") as f, open(output_file, "w", encoding="utf-8") as out:
+        for sentence, (start, end) in split_windows(read_windows(f, window_size)):
+            record = {"file": input_file, "sentence_idx": count, "text": sentence, "char_offsets": [start, end]}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+            if count % 100000 == 0:
+                logging.info(f"Split {count} sentences so far")
+    logging.info(f"Streamed {count} sentences from {input_file} into {output_file}")
+
+
 if __name__ == "__main__":
-    input_file = "projects/prls/inputs/inputted_facts_2024-10-29T02:39:37-07:00.txt"
-    output_file = "projects/prls/chunked_articles_flair.json"
-    split_text_into_sentences(input_file, output_file)
+    parser = argparse.ArgumentParser(description="Split a text input into sentences")
+    parser.add_argument("--input", default="projects/prls/inputs/inputted_facts_2024-10-29T02:39:37-07:00.txt")
+    parser.add_argument("--output", help="defaults to chunked_articles_flair.json, or chunked_sentences.jsonl with --stream")
+    parser.add_argument(
+        "--stream", action="store_true", help="read in windows with constant memory and write JSONL"
+    )
+    parser.add_argument("--window-size", type=int, default=WINDOW_SIZE, help="characters per window")
+    args = parser.parse_args()
+
+    if args.stream:
+        output_file = args.output or "projects/prls/chunked_sentences.jsonl"
+        stream_text_into_sentences(args.input, output_file, args.window_size)
+    else:
+        output_file = args.output or "projects/prls/chunked_articles_flair.json"
+        split_text_into_sentences(args.input, output_file)